@@ -0,0 +1,307 @@
+# backend/archive.py
+"""
+Cold archival of aged device readings.
+
+Readings older than ARCHIVE_AFTER_DAYS are moved out of the hot device
+collection into zstd-compressed NDJSON segment files partitioned by day and
+device:
+
+    <ARCHIVE_DIR>/<YYYY-MM-DD>/<Device_ID>.ndjson.zst
+    <ARCHIVE_DIR>/index.json          # sidecar: device, day, time range, count and frames per segment
+
+Every flush appends one zstd frame to its segment, records the frame's byte
+offset, length and time range in the sidecar index, and only then deletes the
+archived documents from Mongo. Reads use the index to pick the segments, and
+within them the frames, that overlap the requested device and time range;
+each selected frame is read with one seek and decompressed on its own.
+Segments written before frames were indexed are still read whole.
+
+Run it in-process (ARCHIVE_ENABLED=True, on a single worker) or from cron:
+
+    python -m backend.archive --once
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import orjson
+
+from backend.config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_DIR, ARCHIVE_INTERVAL_SECONDS
+from backend.database import device_col
+from backend.responses import dumps
+
+logger = logging.getLogger("archive")
+
+SEGMENT_SUFFIX = ".ndjson.zst"
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return _utc(value)
+    if isinstance(value, str):
+        try:
+            return _utc(datetime.fromisoformat(value))
+        except ValueError:
+            return None
+    return None
+
+
+def _overlaps(entry: Dict, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    """Whether a segment or frame index entry can hold readings in [start, end)."""
+    if start is not None and entry["end"] and datetime.fromisoformat(entry["end"]) < start:
+        return False
+    if end is not None and entry["start"] and datetime.fromisoformat(entry["start"]) >= end:
+        return False
+    return True
+
+
+def _entry_end(entry: Dict) -> datetime:
+    return datetime.fromisoformat(entry["end"]) if entry["end"] else datetime.min.replace(tzinfo=timezone.utc)
+
+
+class SegmentStore:
+    """Segment files plus the sidecar index describing them."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+        self._segments: Dict[str, Dict] = {}
+        self._index_mtime: Optional[float] = None
+
+    # ---------------------
+    # Sidecar index
+    # ---------------------
+    def _load_index(self) -> None:
+        """Reload the sidecar if another process (or the archiver) rewrote it."""
+        try:
+            mtime = self.index_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._index_mtime:
+            return
+        segments = json.loads(self.index_path.read_text())
+        self._segments = {seg["path"]: seg for seg in segments}
+        self._index_mtime = mtime
+
+    def _save_index(self) -> None:
+        tmp = self.index_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(sorted(self._segments.values(), key=lambda s: s["path"])))
+        os.replace(tmp, self.index_path)
+        self._index_mtime = self.index_path.stat().st_mtime
+
+    def segments_for(self, device: str, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None) -> List[Dict]:
+        with self._lock:
+            self._load_index()
+            matches = [seg for seg in self._segments.values()
+                       if seg["device"] == device and _overlaps(seg, start, end)]
+            return sorted(matches, key=_entry_end, reverse=True)
+
+    # ---------------------
+    # Segment I/O
+    # ---------------------
+    def append(self, device: str, day: str, docs: List[Dict]) -> None:
+        """Append `docs` (one device, one day) to their segment as a new zstd frame."""
+        import zstandard
+
+        rel_path = f"{day}/{_UNSAFE_CHARS.sub('_', device) or '_'}{SEGMENT_SUFFIX}"
+        path = self.root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = b"".join(dumps(doc) + b"\n" for doc in docs)
+        frame = zstandard.ZstdCompressor(level=10).compress(payload)
+        with open(path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+
+        timestamps = [_parse_ts(doc.get("timestamp")) for doc in docs]
+        timestamps = [ts for ts in timestamps if ts is not None]
+        start = min(timestamps).isoformat() if timestamps else None
+        end = max(timestamps).isoformat() if timestamps else None
+        with self._lock:
+            self._load_index()
+            seg = self._segments.setdefault(rel_path, {
+                "path": rel_path, "device": device, "day": day, "start": None, "end": None, "count": 0,
+                "frames": [],
+            })
+            if timestamps:
+                seg["start"] = min(seg["start"], start, key=datetime.fromisoformat) if seg["start"] else start
+                seg["end"] = max(seg["end"], end, key=datetime.fromisoformat) if seg["end"] else end
+            # A segment from before frames were indexed has unlisted frames and stays a whole-file read
+            if "frames" in seg:
+                seg["frames"].append({
+                    "offset": offset, "length": len(frame), "start": start, "end": end, "count": len(docs),
+                })
+            seg["count"] += len(docs)
+            self._save_index()
+
+    def _read_segment(self, rel_path: str) -> List[Dict]:
+        import zstandard
+
+        with open(self.root / rel_path, "rb") as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            text = io.TextIOWrapper(reader, encoding="utf-8")
+            docs = [orjson.loads(line) for line in text if line.strip()]
+        for doc in docs:
+            doc["timestamp"] = _parse_ts(doc.get("timestamp")) or doc.get("timestamp")
+        return docs
+
+    def _read_frame(self, rel_path: str, frame: Dict) -> List[Dict]:
+        import zstandard
+
+        with open(self.root / rel_path, "rb") as f:
+            f.seek(frame["offset"])
+            payload = zstandard.ZstdDecompressor().decompress(f.read(frame["length"]))
+        docs = [orjson.loads(line) for line in payload.splitlines() if line.strip()]
+        for doc in docs:
+            doc["timestamp"] = _parse_ts(doc.get("timestamp")) or doc.get("timestamp")
+        return docs
+
+    def read(self, device: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             limit: Optional[int] = None) -> List[Dict]:
+        """Archived readings for `device` in [start, end), newest first."""
+        # (end, segment, frame) for every indexed frame in range; frame None = whole legacy segment
+        blocks = []
+        for seg in self.segments_for(device, start, end):
+            if "frames" not in seg:
+                blocks.append((_entry_end(seg), seg, None))
+                continue
+            blocks.extend((_entry_end(frame), seg, frame) for frame in seg["frames"] if _overlaps(frame, start, end))
+        blocks.sort(key=lambda block: block[0], reverse=True)
+
+        results: List[Dict] = []
+        seen_ids = set()
+        for i, (_, seg, frame) in enumerate(blocks):
+            docs = self._read_segment(seg["path"]) if frame is None else self._read_frame(seg["path"], frame)
+            for doc in docs:
+                ts = doc.get("timestamp")
+                if not isinstance(ts, datetime):
+                    continue
+                if (start is not None and ts < start) or (end is not None and ts >= end):
+                    continue
+                # A crash between writing a frame and deleting from Mongo can archive a doc twice
+                if doc.get("_id") in seen_ids:
+                    continue
+                seen_ids.add(doc.get("_id"))
+                results.append(doc)
+            if limit is not None and len(results) >= limit:
+                results.sort(key=lambda d: d["timestamp"], reverse=True)
+                # Blocks are newest-first by end, so once the next one ends before the
+                # limit-th newest reading found so far, nothing further can make the cut
+                if i + 1 == len(blocks) or blocks[i + 1][0] < results[limit - 1]["timestamp"]:
+                    break
+        results.sort(key=lambda d: d["timestamp"], reverse=True)
+        return results[:limit] if limit is not None else results
+
+    @property
+    def has_segments(self) -> bool:
+        with self._lock:
+            self._load_index()
+            return bool(self._segments)
+
+
+class Archiver:
+    """Moves readings older than `after_days` from `collection` into a SegmentStore."""
+
+    def __init__(self, collection, store: SegmentStore, after_days: float = 30,
+                 batch_size: int = 5000, interval_seconds: float = 3600):
+        self.collection = collection
+        self.store = store
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.after_days)
+        self.collection.create_index([("Device_ID", 1), ("timestamp", 1)])
+        cursor = (
+            self.collection.find({"timestamp": {"$lt": cutoff}})
+            .sort([("Device_ID", 1), ("timestamp", 1)])
+            .batch_size(self.batch_size)
+        )
+        archived = 0
+        group_key = None
+        buffer: List[Dict] = []
+        for doc in cursor:
+            if self._stop.is_set():
+                break
+            key = (str(doc.get("Device_ID") or "unknown"), _utc(doc["timestamp"]).strftime("%Y-%m-%d"))
+            if buffer and (key != group_key or len(buffer) >= self.batch_size):
+                archived += self._flush(group_key, buffer)
+                buffer = []
+            group_key = key
+            buffer.append(doc)
+        if buffer:
+            archived += self._flush(group_key, buffer)
+        if archived:
+            logger.info(f"Archived {archived} readings older than {cutoff.isoformat()}")
+        return archived
+
+    def _flush(self, key, docs: List[Dict]) -> int:
+        device, day = key
+        self.store.append(device, day, docs)
+        self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        return len(docs)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reading-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"Archive run failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+
+segment_store = SegmentStore(ARCHIVE_DIR)
+archiver = Archiver(
+    device_col,
+    segment_store,
+    after_days=ARCHIVE_AFTER_DAYS,
+    batch_size=ARCHIVE_BATCH_SIZE,
+    interval_seconds=ARCHIVE_INTERVAL_SECONDS,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive aged device readings to segment files.")
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.once:
+        print(f"Archived {archiver.run_once()} readings into {ARCHIVE_DIR}")
+        return
+    archiver._run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,21 @@
 # auth.py  —  Enterprise-grade secure version
 
 import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from dotenv import load_dotenv
 import logging
 
-# ----------------------------------------------------
-# Load .env variables
-# ----------------------------------------------------
-load_dotenv()
+# Importing config loads the .env file
+from backend.config import TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL_SECONDS
 
 # ----------------------------------------------------
 # Logger setup
@@ -91,6 +92,67 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         )
 
 
+# =====================================================================================
+# VERIFIED TOKEN CACHE
+# =====================================================================================
+class VerifiedTokenCache:
+    """
+    Bounded LRU map of sha256(token) -> claims for tokens that passed `jwt.decode`.
+
+    An entry lives until the token's `exp` or `ttl_seconds`, whichever comes
+    first, so repeat callers skip signature verification without ever being
+    accepted past expiry. Failed tokens are never cached.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, token: str) -> Dict:
+        """Verified claims of `token`; raises JWTError like `jwt.decode`."""
+        if self.max_entries <= 0:
+            return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._entries[key]
+            self.misses += 1
+
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        expires_at = now + self.ttl_seconds
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, claims["exp"])
+        with self._lock:
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(claims)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+token_cache = VerifiedTokenCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL_SECONDS)
+
+
 # =====================================================================================
 # TOKEN VERIFICATION (used by API /profile-data etc.)
 # =====================================================================================
@@ -100,7 +162,7 @@ def get_current_user_email(token: str = Depends(oauth2_scheme)) -> str:
     Returns: email string
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_cache.decode(token)
         email = payload.get("email")
 
         if not email:
@@ -0,0 +1,246 @@
+# backend/bulk_import.py
+"""
+Streaming bulk import for shipments.
+
+The request body is consumed chunk by chunk, every record is validated against
+the `Shipment` model and valid rows are flushed with `insert_many` in fixed-size
+batches, so memory stays bounded no matter how many rows are uploaded.
+"""
+
+import csv
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from backend.models import Shipment
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+DEFAULT_MAX_ERRORS = 1000
+MAX_REPORTED_ERRORS = 10000  # upper bound on the per-row error list a caller can ask for
+MAX_LINE_BYTES = 1 << 20  # a single record larger than 1 MiB is rejected
+
+CSV_CONTENT_TYPES = {"text/csv", "application/csv"}
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"}
+
+
+class BulkImportError(ValueError):
+    """Raised when the upload itself (not a single row) is unusable."""
+
+
+def detect_format(content_type: str, explicit: Optional[str] = None) -> str:
+    """Resolve the upload format from an explicit `format` param or the content type."""
+    if explicit:
+        fmt = explicit.strip().lower()
+        if fmt in {"csv", "ndjson"}:
+            return fmt
+        raise BulkImportError(f"Unsupported format '{explicit}'. Use 'csv' or 'ndjson'.")
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type in CSV_CONTENT_TYPES:
+        return "csv"
+    if media_type in NDJSON_CONTENT_TYPES:
+        return "ndjson"
+    raise BulkImportError("Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson.")
+
+
+# ---------------------
+# Incremental parsing
+# ---------------------
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into decoded lines without buffering the whole body."""
+    buffer = bytearray()
+    first = True
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.extend(chunk)
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line = buffer[start:end].decode("utf-8").rstrip("\r")
+            if first:
+                line, first = line.lstrip("\ufeff"), False
+            yield line
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > MAX_LINE_BYTES:
+            raise BulkImportError(f"Line exceeds {MAX_LINE_BYTES} bytes.")
+    if buffer:
+        line = buffer.decode("utf-8").rstrip("\r")
+        yield line.lstrip("\ufeff") if first else line
+
+
+async def iter_ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (row_number, parsed_value) for every non-blank NDJSON line."""
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row, BulkImportError(f"Invalid JSON: {e.msg}")
+
+
+async def iter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (row_number, dict) for every CSV record; quoted fields may span lines."""
+    header: Optional[List[str]] = None
+    pending: List[str] = []
+    pending_length = 0
+    open_quote = False
+    row = 0
+    async for line in lines:
+        pending.append(line)
+        # Running quote parity and size, so each line is scanned once however long the record
+        pending_length += len(line) + 1
+        open_quote ^= line.count('"') % 2 == 1
+        if open_quote:
+            # Inside a quoted field that continues on the next line
+            if pending_length > MAX_LINE_BYTES:
+                raise BulkImportError(f"Record exceeds {MAX_LINE_BYTES} bytes.")
+            continue
+        record_text = "\n".join(pending)
+        pending.clear()
+        pending_length = 0
+        if not record_text.strip():
+            continue
+        try:
+            values = next(csv.reader([record_text]))
+        except csv.Error as e:
+            if header is None:
+                raise BulkImportError(f"Invalid CSV header: {e}")
+            row += 1
+            yield row, BulkImportError(f"Invalid CSV: {e}")
+            continue
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, BulkImportError(f"Expected {len(header)} columns, got {len(values)}.")
+            continue
+        yield row, dict(zip(header, values))
+    if pending:
+        row += 1
+        yield row, BulkImportError("Unterminated quoted field at end of upload.")
+
+
+# ---------------------
+# Validation
+# ---------------------
+def validate_row(raw: object, created_by_email: str, created_at: datetime) -> Tuple[Optional[Dict], List[str]]:
+    """Validate one record; returns (document, []) or (None, error messages)."""
+    if isinstance(raw, Exception):
+        return None, [str(raw)]
+    if not isinstance(raw, dict):
+        return None, ["Row must be a JSON object."]
+    data = dict(raw)
+    data["created_at"] = created_at
+    try:
+        shipment = Shipment.model_validate(data)
+    except ValidationError as e:
+        return None, [
+            f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+        ]
+    doc = shipment.model_dump()
+    doc["created_by_email"] = created_by_email
+    return doc, []
+
+
+class ImportReport:
+    """Counters plus a capped per-row error list."""
+
+    def __init__(self, max_errors: int = DEFAULT_MAX_ERRORS):
+        self.max_errors = min(max(0, max_errors), MAX_REPORTED_ERRORS)
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.errors_truncated = False
+        self.aborted: Optional[str] = None
+        self.write_failed = False  # aborted because the database rejected a whole batch
+
+    def add_error(self, row: int, messages: List[str]) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "errors": messages})
+        else:
+            self.errors_truncated = True
+
+    def as_dict(self) -> Dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.errors_truncated,
+            "aborted": self.aborted,
+        }
+
+
+def insert_batch(collection, docs: List[Dict]) -> Tuple[int, Dict[int, str]]:
+    """
+    Unordered `insert_many` of one batch.
+    Returns (inserted_count, {batch_index: error message}) for rows Mongo rejected.
+    """
+    try:
+        result = collection.insert_many(docs, ordered=False)
+        return len(result.inserted_ids), {}
+    except BulkWriteError as e:
+        details = e.details or {}
+        failures = {err["index"]: err.get("errmsg", "Write failed.") for err in details.get("writeErrors", [])}
+        return details.get("nInserted", len(docs) - len(failures)), failures
+
+
+async def import_shipments(
+    rows: AsyncIterator[Tuple[int, object]],
+    write_batch: Callable[[List[Dict]], Awaitable[Tuple[int, Dict[int, str]]]],
+    created_by_email: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_errors: int = DEFAULT_MAX_ERRORS,
+) -> ImportReport:
+    """Validate `rows` incrementally and flush valid documents through `write_batch`."""
+    report = ImportReport(max_errors=max_errors)
+    created_at = datetime.now(timezone.utc)
+    batch: List[Dict] = []
+    batch_rows: List[int] = []
+
+    async def flush():
+        try:
+            inserted, failures = await write_batch(batch)
+        except PyMongoError as e:
+            # How much of the batch landed is unknown: count it as failed and stop writing
+            inserted, failures = 0, {index: f"Batch write failed: {e}" for index in range(len(batch))}
+            report.aborted = f"Database write failed: {e}"
+            report.write_failed = True
+        report.inserted += inserted
+        for index, message in failures.items():
+            report.add_error(batch_rows[index], [message])
+        batch.clear()
+        batch_rows.clear()
+
+    try:
+        async for row, raw in rows:
+            report.rows += 1
+            doc, errors = validate_row(raw, created_by_email, created_at)
+            if errors:
+                report.add_error(row, errors)
+                continue
+            batch.append(doc)
+            batch_rows.append(row)
+            if len(batch) >= batch_size:
+                await flush()
+                if report.write_failed:
+                    break
+    except (BulkImportError, UnicodeDecodeError) as e:
+        # Rows already validated are still written; the report says where the upload broke
+        report.aborted = str(e)
+    if batch:
+        await flush()
+    return report
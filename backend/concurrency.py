@@ -0,0 +1,184 @@
+# backend/concurrency.py
+"""
+Adaptive concurrency limits and load shedding for heavy routes.
+
+Each limited route has an `AdaptiveLimiter`: at most `limit` requests run at
+once, up to `max_queue` more wait in FIFO order, and a waiter that is not
+admitted within `queue_timeout` is shed with `503` + `Retry-After`.
+
+The limit adapts AIMD-style to measured latency: every request that finishes
+under the latency threshold raises the limit by 1/limit (about +1 per
+"window" of requests), and a slower one multiplies it by `backoff`. Only
+requests admitted while the limiter was saturated (they took the last free
+slot or had to queue) may raise it, so light load that never reaches the
+limit does not drift it up to `max_limit`. The
+threshold is `target_latency` when configured, otherwise `tolerance` times
+the best latency recently observed (a gradient-style no-load baseline).
+
+Everything runs on the event loop, so no locks are needed.
+"""
+
+import asyncio
+import math
+from collections import deque
+from time import monotonic
+from typing import Dict, Iterable, Optional, Tuple
+
+from backend import config
+from backend.responses import FastJSONResponse
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, initial: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 max_queue: int = 32, queue_timeout: float = 2.0, target_latency: Optional[float] = None,
+                 tolerance: float = 2.0, backoff: float = 0.9, baseline_window: int = 500):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.baseline_window = baseline_window
+        self.inflight = 0
+        self._waiters: deque = deque()
+        self._best_latency: Optional[float] = None
+        self._window_best: Optional[float] = None
+        self._window_count = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    # ---------------------
+    # Admission
+    # ---------------------
+    async def acquire(self) -> Tuple[bool, bool]:
+        """(admitted, saturated): saturated when this request filled the limit or queued for it."""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return True, self.inflight >= int(self.limit)
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False, True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.timed_out += 1
+            return False, True
+        except asyncio.CancelledError:
+            # Client disconnect or shutdown while queued: never keep a slot nobody will release
+            self._abandon(waiter)
+            raise
+        self.admitted += 1
+        return True, True
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # Admitted in the same tick the wait ended: hand the slot back
+            self.inflight -= 1
+            self._wake()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, latency: float, saturated: bool) -> None:
+        self.inflight -= 1
+        self._adapt(latency, saturated)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():  # timed out or cancelled while queued
+                continue
+            self.inflight += 1
+            waiter.set_result(True)
+
+    # ---------------------
+    # Limit adaptation
+    # ---------------------
+    def _threshold(self) -> Optional[float]:
+        if self.target_latency:
+            return self.target_latency
+        return self._best_latency * self.tolerance if self._best_latency is not None else None
+
+    def _adapt(self, latency: float, saturated: bool) -> None:
+        # The baseline is the best latency of the previous window, so it can move up again
+        self._window_best = latency if self._window_best is None else min(self._window_best, latency)
+        self._window_count += 1
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+        if self._window_count >= self.baseline_window:
+            self._best_latency, self._window_best, self._window_count = self._window_best, None, 0
+
+        threshold = self._threshold()
+        if threshold is not None and latency > threshold:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif saturated:
+            # A fast request that never hit the limit says nothing about whether more would fit
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self) -> Dict:
+        threshold = self._threshold()
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "latency_threshold_ms": round(threshold * 1000, 1) if threshold is not None else None,
+        }
+
+
+class ConcurrencyLimitMiddleware:
+    """Pure ASGI middleware applying `limiters` (keyed by exact path) to matching requests."""
+
+    def __init__(self, app, limiters: Dict[str, AdaptiveLimiter]):
+        self.app = app
+        self.limiters = limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        admitted, saturated = await limiter.acquire()
+        if not admitted:
+            response = FastJSONResponse(
+                {"detail": "Server busy, please retry shortly."},
+                status_code=503,
+                headers={"Retry-After": str(max(1, math.ceil(limiter.queue_timeout)))},
+            )
+            return await response(scope, receive, send)
+        started = monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(monotonic() - started, saturated)
+
+
+def build_limiters(paths: Iterable[str]) -> Dict[str, AdaptiveLimiter]:
+    target_ms = config.CONCURRENCY_TARGET_LATENCY_MS
+    return {
+        path: AdaptiveLimiter(
+            path,
+            initial=config.CONCURRENCY_INITIAL_LIMIT,
+            min_limit=config.CONCURRENCY_MIN_LIMIT,
+            max_limit=config.CONCURRENCY_MAX_LIMIT,
+            max_queue=config.CONCURRENCY_MAX_QUEUE,
+            queue_timeout=config.CONCURRENCY_QUEUE_TIMEOUT_SECONDS,
+            target_latency=target_ms / 1000 if target_ms > 0 else None,
+        )
+        for path in paths
+    }
+
+
+# Routes that can pin Mongo under load; cheap pages (login, static) are never queued
+heavy_route_limiters = build_limiters(["/devices", "/my-shipments", "/api/devices"])
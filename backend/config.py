@@ -1,12 +1,12 @@
 # config.py
 
 import os
+from functools import lru_cache
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
-from fastapi_mail import ConnectionConfig
 
-# Load environment variables
+# Load environment variables (once, for the whole backend)
 load_dotenv()
 
 # Base directory
@@ -16,9 +16,10 @@ BASE_DIR = Path(__file__).resolve().parent
 # -----------------------------
 # MongoDB Configuration
 # -----------------------------
+# Checked when the first connection is made (backend.database), not at import
 MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    raise RuntimeError("❌ MONGO_URI is missing in your .env file")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
 
 DATA_BASE = os.getenv("DATA_BASE", "scm")
 
@@ -30,8 +31,6 @@ SHIPMENTS_COLLECTION = os.getenv("SHIPMENTS_COLLECTION", "shipments")
 # JWT & Authentication
 # -----------------------------
 SECRET_KEY = os.getenv("SECRET_KEY")
-if not SECRET_KEY:
-    raise RuntimeError("❌ SECRET_KEY is missing in your .env file")
 
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
@@ -62,6 +61,104 @@ KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "sensor_data")
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka:9092")
 
 
+# -----------------------------
+# Device Index (device -> shipment cache)
+# -----------------------------
+DEVICE_INDEX_POLL_SECONDS = float(os.getenv("DEVICE_INDEX_POLL_SECONDS", "5"))
+DEVICE_INDEX_RESYNC_SECONDS = float(os.getenv("DEVICE_INDEX_RESYNC_SECONDS", "300"))  # full reload in delta-sync mode; 0 = never
+DEVICE_INDEX_OVERLAP_SECONDS = float(os.getenv("DEVICE_INDEX_OVERLAP_SECONDS", "10"))  # delta-sync re-read window behind the watermark
+
+
+# -----------------------------
+# Cold Archive (aged device readings -> segment files)
+# -----------------------------
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "False") == "True"
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", str(BASE_DIR.parent / "archive")))
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+
+# -----------------------------
+# Device Stream Queries
+# -----------------------------
+STREAM_LATEST_LIMIT = int(os.getenv("STREAM_LATEST_LIMIT", "50"))
+STREAM_MAX_POINTS = int(os.getenv("STREAM_MAX_POINTS", "1000"))  # LTTB target for time-range queries
+STREAM_MAX_RANGE_DAYS = float(os.getenv("STREAM_MAX_RANGE_DAYS", "31"))
+# Per-device in-memory ring of recent readings, fed from KAFKA_TOPIC
+READING_BUFFER_ENABLED = os.getenv("READING_BUFFER_ENABLED", "True") == "True"
+READING_BUFFER_SIZE = int(os.getenv("READING_BUFFER_SIZE", "256"))
+# Per-lane device last-seen documents expire this long after a device's last reading
+ROUTE_DEVICE_RETENTION_DAYS = int(os.getenv("ROUTE_DEVICE_RETENTION_DAYS", "30"))
+
+
+# -----------------------------
+# Per-user Shipment Summary
+# -----------------------------
+SUMMARY_RECONCILE_ENABLED = os.getenv("SUMMARY_RECONCILE_ENABLED", "True") == "True"
+SUMMARY_RECONCILE_SECONDS = float(os.getenv("SUMMARY_RECONCILE_SECONDS", "3600"))
+
+
+# -----------------------------
+# Profiling & Slow-Query Log
+# -----------------------------
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # admin secret for the X-Profile header; unset disables it
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(BASE_DIR.parent / "profiles")))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))  # 0 disables the slow-query log
+
+
+# -----------------------------
+# Templates (bytecode + fragment caches)
+# -----------------------------
+TEMPLATE_CACHE_DIR = Path(os.getenv("TEMPLATE_CACHE_DIR", str(BASE_DIR.parent / ".jinja_cache")))
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "True") == "True"  # False in production: skip mtime checks
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "512"))
+FRAGMENT_CACHE_TTL_SECONDS = float(os.getenv("FRAGMENT_CACHE_TTL_SECONDS", "60"))
+
+
+# -----------------------------
+# Query Result Cache
+# -----------------------------
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "256"))
+
+
+# -----------------------------
+# Verified JWT Cache
+# -----------------------------
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))  # 0 disables the cache
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))  # never beyond the token's exp
+
+
+# -----------------------------
+# Adaptive Concurrency Limits (heavy routes)
+# -----------------------------
+CONCURRENCY_LIMIT_ENABLED = os.getenv("CONCURRENCY_LIMIT_ENABLED", "True") == "True"
+CONCURRENCY_INITIAL_LIMIT = int(os.getenv("CONCURRENCY_INITIAL_LIMIT", "8"))
+CONCURRENCY_MIN_LIMIT = int(os.getenv("CONCURRENCY_MIN_LIMIT", "1"))
+CONCURRENCY_MAX_LIMIT = int(os.getenv("CONCURRENCY_MAX_LIMIT", "64"))
+CONCURRENCY_MAX_QUEUE = int(os.getenv("CONCURRENCY_MAX_QUEUE", "32"))
+CONCURRENCY_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT_SECONDS", "2"))
+CONCURRENCY_TARGET_LATENCY_MS = float(os.getenv("CONCURRENCY_TARGET_LATENCY_MS", "0"))  # 0 = learn from baseline
+
+
+# -----------------------------
+# Rate Limiting ("count/seconds", empty disables a limit)
+# -----------------------------
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "False") == "True"
+
+RATE_LIMIT_LOGIN_IP = os.getenv("RATE_LIMIT_LOGIN_IP", "20/60")
+RATE_LIMIT_LOGIN_ACCOUNT = os.getenv("RATE_LIMIT_LOGIN_ACCOUNT", "5/60")
+RATE_LIMIT_SIGNUP_IP = os.getenv("RATE_LIMIT_SIGNUP_IP", "5/300")
+RATE_LIMIT_PASSWORD_RESET_IP = os.getenv("RATE_LIMIT_PASSWORD_RESET_IP", "10/600")
+RATE_LIMIT_WRITES_IP = os.getenv("RATE_LIMIT_WRITES_IP", "120/60")
+RATE_LIMIT_WRITES_ACCOUNT = os.getenv("RATE_LIMIT_WRITES_ACCOUNT", "60/60")
+
+
 # -----------------------------
 # Token Expiry Helper
 # -----------------------------
@@ -83,13 +180,18 @@ MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "True") == "True"
 MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "False") == "True"
 USE_CREDENTIALS = os.getenv("USE_CREDENTIALS", "True") == "True"
 
-mail_conf = ConnectionConfig(
-    MAIL_USERNAME=MAIL_USERNAME,
-    MAIL_PASSWORD=MAIL_PASSWORD,
-    MAIL_FROM=MAIL_FROM,
-    MAIL_PORT=MAIL_PORT,
-    MAIL_SERVER=MAIL_SERVER,
-    MAIL_STARTTLS=MAIL_STARTTLS,
-    MAIL_SSL_TLS=MAIL_SSL_TLS,
-    USE_CREDENTIALS=USE_CREDENTIALS
-)
+@lru_cache(maxsize=1)
+def get_mail_conf():
+    """Built on first use: fastapi_mail is slow to import and validates the settings eagerly."""
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=MAIL_USERNAME,
+        MAIL_PASSWORD=MAIL_PASSWORD,
+        MAIL_FROM=MAIL_FROM,
+        MAIL_PORT=MAIL_PORT,
+        MAIL_SERVER=MAIL_SERVER,
+        MAIL_STARTTLS=MAIL_STARTTLS,
+        MAIL_SSL_TLS=MAIL_SSL_TLS,
+        USE_CREDENTIALS=USE_CREDENTIALS
+    )
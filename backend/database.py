@@ -1,38 +1,137 @@
 import os
-from dotenv import load_dotenv
+import logging
+import threading
+from time import perf_counter
+from typing import Dict, Optional
+
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 import bcrypt
 
-# Load .env file
-load_dotenv()
+# Importing config loads the .env file once for the whole backend
+from backend.config import MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_SERVER_SELECTION_TIMEOUT_MS, SLOW_QUERY_MS
+from backend.config import ROUTE_DEVICE_RETENTION_DAYS
+from backend.profiling import get_slow_query_listener
+
+logger = logging.getLogger("database")
 
 # ------------------------------
 # Read MongoDB Connection Values
 # ------------------------------
-MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME")  # FIXED
 
 USERS_COLLECTION_NAME = os.getenv("USERS_COLLECTION")
 SHIPMENTS_COLLECTION_NAME = os.getenv("SHIPMENTS_COLLECTION")
 DEVICE_COLLECTION_NAME = os.getenv("DEVICE_DATA_COLLECTION")
 
-# Debugging prints
-print("Loaded DB_NAME:", DB_NAME)
-print("Loaded USERS_COLLECTION:", USERS_COLLECTION_NAME)
-print("Loaded SHIPMENTS_COLLECTION:", SHIPMENTS_COLLECTION_NAME)
-print("Loaded DEVICE_DATA_COLLECTION:", DEVICE_COLLECTION_NAME)
-
 # ------------------------------
-# Connect to MongoDB
+# Lazy MongoDB client
 # ------------------------------
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
+# Nothing connects at import time: the client is created on first use or by
+# `connect()` from the FastAPI lifespan, and released again by `close()`.
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not MONGO_URI:
+                    raise RuntimeError("❌ MONGO_URI is missing in your .env file")
+                slow_query_listener = get_slow_query_listener(SLOW_QUERY_MS)
+                _client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    event_listeners=[slow_query_listener] if slow_query_listener else None,
+                )
+                logger.info(f"MongoDB client created for database '{DB_NAME}'")
+    return _client
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+def ping() -> Dict:
+    """Round-trip to the server; used for warm-up and the readiness probe."""
+    started = perf_counter()
+    try:
+        get_client().admin.command("ping")
+        return {"ok": True, "latency_ms": round((perf_counter() - started) * 1000, 2)}
+    except Exception as e:
+        logger.warning(f"MongoDB ping failed: {e}")
+        return {"ok": False, "error": type(e).__name__}
+
+
+def connect() -> Dict:
+    """Create the client and warm up a pooled connection."""
+    result = ping()
+    if result["ok"]:
+        logger.info(f"MongoDB ready in {result['latency_ms']} ms")
+    else:
+        logger.warning("MongoDB warm-up failed; readiness probe will report unavailable")
+    return result
+
+
+def ensure_indexes() -> None:
+    """Indexes the request paths rely on, whichever background jobs are enabled."""
+    try:
+        # Latest-readings feed and /api/stream/{device} range queries
+        device_col.create_index([("Device_ID", 1), ("timestamp", 1)])
+        # Active-device counts per lane; the TTL keeps the collection bounded (same spec as the consumer)
+        route_devices_col.create_index([("last_seen", 1)], expireAfterSeconds=ROUTE_DEVICE_RETENTION_DAYS * 86400)
+        route_devices_col.create_index([("route", 1), ("last_seen", 1)])
+    except PyMongoError as e:
+        logger.warning(f"Index creation failed: {e}")
+
+
+def close() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+class LazyCollection:
+    """Stand-in for a pymongo Collection that resolves it on first use."""
+
+    def __init__(self, name: Optional[str]):
+        self._name = name
+        self._client = None
+        self._collection = None
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._name
+
+    def resolve(self):
+        client = get_client()
+        if self._collection is None or self._client is not client:
+            self._collection = client[DB_NAME][self._name]
+            self._client = client
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self._name!r})"
+
 
 # Collections
-users_col = db[USERS_COLLECTION_NAME]
-shipments_col = db[SHIPMENTS_COLLECTION_NAME]
-device_col = db[DEVICE_COLLECTION_NAME]
-stream_col = db[os.getenv("STREAM_COLLECTION", "device_streams")]
+users_col = LazyCollection(USERS_COLLECTION_NAME)
+shipments_col = LazyCollection(SHIPMENTS_COLLECTION_NAME)
+device_col = LazyCollection(DEVICE_COLLECTION_NAME)
+stream_col = LazyCollection(os.getenv("STREAM_COLLECTION", "device_streams"))
+alerts_col = LazyCollection(os.getenv("ALERTS_COLLECTION", "alerts"))
+route_stats_col = LazyCollection(os.getenv("ROUTE_STATS_COLLECTION", "route_stats"))
+route_devices_col = LazyCollection(os.getenv("ROUTE_DEVICES_COLLECTION", "route_devices"))
+summaries_col = LazyCollection(os.getenv("SUMMARIES_COLLECTION", "shipment_summaries"))
+locks_col = LazyCollection(os.getenv("LOCKS_COLLECTION", "locks"))
 
 # Password Hashing
 def hash_password(password: str) -> str:
@@ -0,0 +1,255 @@
+# backend/device_index.py
+"""
+In-process index of device -> shipment route metadata.
+
+Only the fields lookups need (device, Route_From, Route_To, created_at) are
+kept per shipment, never whole documents. The index is built once from the
+shipments collection and then kept fresh either from a Mongo change stream
+(replica sets / Atlas) or, when change streams are not available, from a
+delta sync that fetches shipments from the highest `_id` seen in Mongo.
+ObjectIds are generated by each client, so they are only roughly ordered
+across app processes: every poll re-reads a DEVICE_INDEX_OVERLAP_SECONDS
+window behind the watermark and skips shipments it already holds, and a
+periodic full resync (DEVICE_INDEX_RESYNC_SECONDS) catches anything older.
+Lookups never touch Mongo once the index is loaded.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from backend.config import (
+    DEVICE_INDEX_OVERLAP_SECONDS,
+    DEVICE_INDEX_POLL_SECONDS,
+    DEVICE_INDEX_RESYNC_SECONDS,
+)
+from backend.database import shipments_col
+
+logger = logging.getLogger("device_index")
+
+# Change stream error codes meaning "not a replica set / not supported here"
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324, 136}
+
+INDEXED_FIELDS = ("Device", "Route_From", "Route_To", "created_at")
+PROJECTION = {field: 1 for field in INDEXED_FIELDS}
+
+
+class DeviceIndex:
+    """Thread-safe device -> latest shipment route map."""
+
+    def __init__(self, collection, poll_seconds: float = 5.0, resync_seconds: float = 300.0,
+                 overlap_seconds: float = 10.0):
+        self._collection = collection
+        self._poll_seconds = poll_seconds
+        self._resync_seconds = resync_seconds
+        self._overlap_seconds = overlap_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[Any, Dict] = {}         # shipment _id -> indexed fields only
+        self._device_of: Dict[Any, str] = {}        # shipment _id -> device
+        self._ids_by_device: Dict[str, Set[Any]] = {}
+        self._by_device: Dict[str, Dict] = {}       # device -> entry of its newest shipment
+        self._sorted_devices: Optional[List[str]] = None
+        self._watermark = None                      # highest shipment _id read back from Mongo
+        self._loaded = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.mode: Optional[str] = None
+        self.version = 0
+
+    # ---------------------
+    # Reads
+    # ---------------------
+    def get(self, device: str) -> Optional[Dict]:
+        self._ensure_loaded()
+        doc = self._by_device.get(device)
+        return dict(doc) if doc is not None else None
+
+    def routes_for(self, devices: Iterable[str]) -> Dict[str, Dict[str, str]]:
+        self._ensure_loaded()
+        routes = {}
+        for device in devices:
+            doc = self._by_device.get(device)
+            if doc is not None:
+                routes[device] = {
+                    "Route_From": doc.get("Route_From", "—"),
+                    "Route_To": doc.get("Route_To", "—"),
+                }
+        return routes
+
+    def devices(self) -> List[str]:
+        self._ensure_loaded()
+        with self._lock:
+            if self._sorted_devices is None:
+                self._sorted_devices = sorted(self._by_device)
+            return self._sorted_devices
+
+    # ---------------------
+    # Writes
+    # ---------------------
+    def apply(self, doc: Dict) -> None:
+        """Insert or replace one shipment document (must carry `_id`)."""
+        self.apply_many([doc])
+
+    def apply_many(self, docs: Iterable[Dict]) -> None:
+        with self._lock:
+            for doc in docs:
+                self._upsert_locked(doc)
+            self._changed_locked()
+
+    def remove(self, shipment_id: Any) -> None:
+        with self._lock:
+            self._remove_locked(shipment_id)
+            self._changed_locked()
+
+    def _upsert_locked(self, doc: Dict) -> None:
+        shipment_id = doc.get("_id")
+        if shipment_id is None:
+            return
+        self._remove_locked(shipment_id)
+        device = doc.get("Device")
+        if not device:
+            return
+        self._entries[shipment_id] = {k: doc[k] for k in INDEXED_FIELDS if k in doc}
+        self._device_of[shipment_id] = device
+        self._ids_by_device.setdefault(device, set()).add(shipment_id)
+        self._refresh_device_locked(device)
+
+    def _remove_locked(self, shipment_id: Any) -> None:
+        device = self._device_of.pop(shipment_id, None)
+        self._entries.pop(shipment_id, None)
+        if device is None:
+            return
+        ids = self._ids_by_device.get(device)
+        if ids is not None:
+            ids.discard(shipment_id)
+            if not ids:
+                del self._ids_by_device[device]
+        self._refresh_device_locked(device)
+
+    def _refresh_device_locked(self, device: str) -> None:
+        ids = self._ids_by_device.get(device)
+        if ids:
+            # The newest shipment for a device wins
+            self._by_device[device] = self._entries[max(ids)]
+        else:
+            self._by_device.pop(device, None)
+
+    def _changed_locked(self) -> None:
+        self._sorted_devices = None
+        self.version += 1
+
+    # ---------------------
+    # Loading & sync
+    # ---------------------
+    def load(self) -> None:
+        """(Re)build the whole index from Mongo."""
+        docs = list(self._collection.find({"Device": {"$exists": True}}, PROJECTION).sort("_id", 1))
+        with self._lock:
+            self._entries.clear()
+            self._device_of.clear()
+            self._ids_by_device.clear()
+            self._by_device.clear()
+            for doc in docs:
+                self._upsert_locked(doc)
+            self._watermark = docs[-1]["_id"] if docs else None
+            self._changed_locked()
+            self._loaded = True
+        logger.info(f"Device index loaded: {len(self._by_device)} devices")
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="device-index-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        use_change_stream = True
+        while not self._stop.is_set():
+            try:
+                if use_change_stream:
+                    self._watch()
+                else:
+                    self._poll()
+            except OperationFailure as e:
+                if use_change_stream and e.code in CHANGE_STREAM_UNSUPPORTED:
+                    logger.info("Change streams unavailable, falling back to delta sync")
+                    use_change_stream = False
+                    continue
+                logger.warning(f"Device index sync failed, retrying: {e}")
+                self._stop.wait(self._poll_seconds)
+            except PyMongoError as e:
+                # Network blips etc.: back off and resume; the thread must outlive them
+                logger.warning(f"Device index sync error, retrying: {e}")
+                self._stop.wait(self._poll_seconds)
+
+    def _watch(self) -> None:
+        self.mode = "change_stream"
+        with self._collection.watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+            # Load after the stream is open so nothing between the two is missed
+            self.load()
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                op = change.get("operationType")
+                if op in {"insert", "update", "replace"} and change.get("fullDocument"):
+                    self.apply(change["fullDocument"])
+                elif op == "delete":
+                    self.remove(change["documentKey"]["_id"])
+                elif op in {"drop", "rename", "dropDatabase", "invalidate"}:
+                    return
+
+    def _since_watermark(self) -> Dict:
+        if self._watermark is None:
+            return {}
+        if isinstance(self._watermark, ObjectId):
+            # Another process may insert an _id below ours a little later: re-read a window
+            start = self._watermark.generation_time - timedelta(seconds=self._overlap_seconds)
+            return {"_id": {"$gte": ObjectId.from_datetime(start)}}
+        return {"_id": {"$gt": self._watermark}}
+
+    def _poll(self) -> None:
+        """Delta sync on the `_id` watermark; resumes from the watermark after an error."""
+        self.mode = "delta_sync"
+        if not self._loaded:
+            self.load()
+        since_resync = 0.0
+        while not self._stop.wait(self._poll_seconds):
+            since_resync += self._poll_seconds
+            if self._resync_seconds > 0 and since_resync >= self._resync_seconds:
+                self.load()
+                since_resync = 0.0
+                continue
+            query = {"Device": {"$exists": True}, **self._since_watermark()}
+            docs = list(self._collection.find(query, PROJECTION).sort("_id", 1))
+            if not docs:
+                continue
+            # Only Mongo's own results move the watermark, never local apply() calls
+            if self._watermark is None or docs[-1]["_id"] > self._watermark:
+                self._watermark = docs[-1]["_id"]
+            fresh = [doc for doc in docs if doc["_id"] not in self._entries]
+            if fresh:
+                self.apply_many(fresh)
+
+
+device_route_index = DeviceIndex(
+    shipments_col,
+    poll_seconds=DEVICE_INDEX_POLL_SECONDS,
+    resync_seconds=DEVICE_INDEX_RESYNC_SECONDS,
+    overlap_seconds=DEVICE_INDEX_OVERLAP_SECONDS,
+)
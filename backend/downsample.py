@@ -0,0 +1,102 @@
+# backend/downsample.py
+"""
+Largest-Triangle-Three-Buckets (LTTB) downsampling.
+
+LTTB keeps the first and last points and, for each of `n_out - 2` equal-size
+buckets in between, the point forming the largest triangle with the point
+kept from the previous bucket and the average of the next bucket. Peaks and
+dips survive, so a chart of ~1000 points looks like the raw series.
+
+The choice in each bucket depends on the previous choice, so buckets are
+visited in order; everything inside a bucket, and the bucket averages, are
+vectorized NumPy.
+
+`downsample_stream` consumes a cursor one document at a time, keeping only
+the requested fields column-wise, so a wide range never holds one dict per
+reading in memory.
+"""
+
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the `n_out` points LTTB keeps from the series (x ascending)."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (n_out - 2)
+    edges = (np.arange(n_out - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < n_out - 2:
+            cx, cy = avg_x[i + 1], avg_y[i + 1]
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_stream(docs: Iterable[Dict], field: str, max_points: int,
+                      fields: Sequence[str]) -> Tuple[int, List[Dict]]:
+    """
+    LTTB over a stream of `docs` (oldest first) with `field` as the y value.
+
+    Returns (points read, kept rows). Rows carry only `fields`, plus a UTC
+    `timestamp`; documents without a datetime `timestamp` are skipped.
+    """
+    columns: Dict[str, list] = {name: [] for name in fields}
+    columns.setdefault("timestamp", [])
+    x = array("d")
+    y = array("d")
+    for doc in docs:
+        ts = doc.get("timestamp")
+        if not isinstance(ts, datetime):
+            continue
+        ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+        x.append(ts.timestamp())
+        y.append(_as_float(doc.get(field)))
+        for name, column in columns.items():
+            column.append(ts if name == "timestamp" else doc.get(name))
+
+    n = len(x)
+    if n > max_points:
+        keep = lttb_indices(np.frombuffer(x), _fill_missing(np.frombuffer(y)), max_points).tolist()
+    else:
+        keep = range(n)
+    return n, [
+        {name: column[i] for name, column in columns.items() if column[i] is not None}
+        for i in keep
+    ]
+
+
+def _fill_missing(y: np.ndarray) -> np.ndarray:
+    # A missing value would poison every triangle in its bucket; use the series mean instead
+    if np.isnan(y).all():
+        return np.zeros_like(y)
+    if np.isnan(y).any():
+        return np.where(np.isnan(y), np.nanmean(y), y)
+    return y
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
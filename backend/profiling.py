@@ -0,0 +1,322 @@
+# backend/profiling.py
+"""
+On-demand request profiling and Mongo slow-query logging.
+
+Profiling is opt-in per request: send `X-Profile: <PROFILE_TOKEN>` or set
+PROFILE_SAMPLE_RATE > 0. While a profiled request runs, a sampler thread
+records wall-clock stacks and writes them in the folded ("collapsed") format
+understood by flamegraph.pl, speedscope and inferno:
+
+    <PROFILE_DIR>/<utc time>_<METHOD>_<path>.folded
+
+Every sample of a profiled request is rooted at `request;<METHOD> <path>`:
+
+- while the request's own task runs on the event loop, its stack;
+- while a threadpool worker runs the request's sync endpoint, that worker's
+  stack (routes built with `ProfiledRoute` register the worker for the call);
+- otherwise the task is waiting, recorded as `[awaiting]` followed by the
+  chain of coroutines it is suspended in.
+
+Other threads (background jobs, other requests' workers) cannot be
+attributed to the request and are rooted at `process-wide;<thread name>`.
+
+Requests that are not profiled only pay for one header lookup and a
+ContextVar set (plus a ContextVar read per sync endpoint call).
+
+`SlowQueryListener` is a pymongo CommandListener that logs every command
+slower than SLOW_QUERY_MS with its collection, filter shape (values replaced
+by "?"), duration and the route that issued it.
+"""
+
+import asyncio
+import functools
+import hmac
+import logging
+import random
+import re
+import sys
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+logger = logging.getLogger("profiling")
+
+# "GET /devices" for the request currently running in this context
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+# Profiler of the request running in this context; the threadpool copies it into workers
+current_profiler: ContextVar[Optional["SamplingProfiler"]] = ContextVar("current_profiler", default=None)
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+# =====================================================================================
+# WALL-CLOCK SAMPLING PROFILER
+# =====================================================================================
+class SamplingProfiler:
+    """
+    Samples thread stacks every `interval` seconds until stopped.
+
+    With a `task`, the event-loop thread is sampled only while that task is
+    the one running, under `request;<label>`. Threads registered with
+    `attach_thread` are recorded under the same root, and when neither is
+    busy the task's await chain is recorded under `request;<label>;[awaiting]`.
+    Every other thread is recorded under `process-wide;<thread name>`.
+    """
+
+    def __init__(self, interval: float = 0.005, task: Optional[asyncio.Task] = None, label: str = "request"):
+        self.interval = interval
+        self.task = task
+        self.label = label
+        self._loop = task.get_loop() if task is not None else None
+        self._loop_thread_id = threading.get_ident() if task is not None else None
+        self.samples: Counter = Counter()
+        self._threads: Dict[int, int] = {}  # worker thread id -> nesting depth
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def attach_thread(self) -> None:
+        """Attribute the calling thread's samples to this request until `detach_thread`."""
+        thread_id = threading.get_ident()
+        with self._threads_lock:
+            self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+
+    def detach_thread(self) -> None:
+        thread_id = threading.get_ident()
+        with self._threads_lock:
+            depth = self._threads.pop(thread_id, 1) - 1
+            if depth:
+                self._threads[thread_id] = depth
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        request_root = f"request;{self.label}"
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                attached = set(self._threads)
+            task_running = False
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id == self._loop_thread_id:
+                    # Another task on the loop is someone else's request
+                    if asyncio.current_task(self._loop) is not self.task:
+                        continue
+                    task_running = True
+                    root = request_root
+                elif thread_id in attached:
+                    root = request_root
+                else:
+                    if thread_id not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    root = f"process-wide;{names.get(thread_id, f'thread-{thread_id}')}"
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(root)
+                self.samples[";".join(reversed(stack))] += 1
+            if self.task is not None and not task_running and not attached and not self.task.done():
+                self.samples[";".join([request_root, "[awaiting]", *self._await_chain()])] += 1
+
+    def _await_chain(self) -> List[str]:
+        """Outermost-first frames of the coroutines the suspended task is waiting in."""
+        chain = []
+        awaitable = self.task.get_coro()
+        try:
+            while awaitable is not None and len(chain) < 200:
+                frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+                         or getattr(awaitable, "gi_frame", None))
+                if frame is None:
+                    break
+                chain.append(_frame_label(frame))
+                awaitable = (getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+                             or getattr(awaitable, "gi_yieldfrom", None))
+        except Exception:
+            # The task may resume under us; a truncated chain is still a valid sample
+            pass
+        return chain
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+class ProfiledRoute(APIRoute):
+    """
+    APIRoute whose sync endpoints register their threadpool worker with the
+    request's profiler, so only that worker's samples count as the request's.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if call is not None and not asyncio.iscoroutinefunction(call) and not getattr(call, "_profiled", False):
+            @functools.wraps(call)
+            def profiled_call(*args, **kwargs):
+                profiler = current_profiler.get()
+                if profiler is None:
+                    return call(*args, **kwargs)
+                profiler.attach_thread()
+                try:
+                    return call(*args, **kwargs)
+                finally:
+                    profiler.detach_thread()
+
+            profiled_call._profiled = True
+            self.dependant.call = profiled_call
+        return super().get_route_handler()
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware: tags every request with its route, profiles the opted-in ones."""
+
+    def __init__(self, app, token: Optional[str] = None, sample_rate: float = 0.0,
+                 out_dir: Path = Path("profiles"), interval: float = 0.005):
+        self.app = app
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.out_dir = Path(out_dir)
+        self.interval = interval
+        self._busy = threading.Lock()  # one profile at a time keeps samples attributable
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = f"{scope['method']} {scope['path']}"
+        token = current_route.set(route)
+        try:
+            if not self._wanted(scope) or not self._busy.acquire(blocking=False):
+                return await self.app(scope, receive, send)
+            try:
+                await self._profile(scope, receive, send, route)
+            finally:
+                self._busy.release()
+        finally:
+            current_route.reset(token)
+
+    def _wanted(self, scope) -> bool:
+        if self.token is not None:
+            for name, value in scope.get("headers", []):
+                if name == b"x-profile":
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def _profile(self, scope, receive, send, route: str) -> None:
+        # Created on the loop thread, so it knows which thread and task are this request's
+        profiler = SamplingProfiler(self.interval, task=asyncio.current_task(), label=route)
+        token = current_profiler.set(profiler)
+        started = monotonic()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            current_profiler.reset(token)
+            elapsed_ms = (monotonic() - started) * 1000
+            path = self._write(route, profiler.folded())
+            logger.info(f"Profiled {route} in {elapsed_ms:.1f} ms -> {path}")
+
+    def _write(self, route: str, folded: str) -> Path:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+        path = self.out_dir / f"{stamp}_{_UNSAFE_CHARS.sub('_', route).strip('_')}.folded"
+        path.write_text(folded)
+        return path
+
+
+# =====================================================================================
+# SLOW-QUERY LOG
+# =====================================================================================
+def filter_shape(value: Any, depth: int = 0) -> Any:
+    """Keep keys and operators, replace literal values with '?'."""
+    if depth > 8:
+        return "?"
+    if isinstance(value, dict):
+        return {k: filter_shape(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = [filter_shape(v, depth + 1) for v in value[:20]]
+        return shapes if any(s != "?" for s in shapes) else ["?"]
+    return "?"
+
+
+# Which part of each command carries its "filter"
+_SHAPE_FIELDS = {
+    "find": "filter", "count": "query", "distinct": "query", "findAndModify": "query",
+    "aggregate": "pipeline", "update": "updates", "delete": "deletes",
+}
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    def __init__(self, threshold_ms: float, max_records: int = 200):
+        self.threshold_us = threshold_ms * 1000
+        self.records: deque = deque(maxlen=max_records)
+        self._started: Dict[Any, tuple] = {}
+
+    def started(self, event):
+        # Keep a reference only; the shape is computed for slow commands alone
+        if len(self._started) < 10_000:
+            self._started[(event.request_id, event.connection_id)] = (event.command, current_route.get())
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool) -> None:
+        entry = self._started.pop((event.request_id, event.connection_id), None)
+        if entry is None or event.duration_micros < self.threshold_us:
+            return
+        command, route = entry
+        name = event.command_name
+        shape_field = _SHAPE_FIELDS.get(name)
+        record = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "command": name,
+            "database": event.database_name,
+            "collection": command.get(name) if isinstance(command.get(name), str) else None,
+            "filter_shape": filter_shape(command.get(shape_field)) if shape_field else None,
+            "duration_ms": round(event.duration_micros / 1000, 2),
+            "route": route,
+            "failed": failed,
+        }
+        self.records.append(record)
+        logger.warning(f"Slow Mongo {name} on {record['collection']} took {record['duration_ms']} ms "
+                       f"(route={route}, shape={record['filter_shape']})")
+
+    def recent(self) -> List[Dict]:
+        return list(reversed(self.records))
+
+
+slow_query_listener: Optional[SlowQueryListener] = None
+
+
+def get_slow_query_listener(threshold_ms: float) -> Optional[SlowQueryListener]:
+    """Shared listener instance; None when the slow-query log is disabled (threshold <= 0)."""
+    global slow_query_listener
+    if threshold_ms <= 0:
+        return None
+    if slow_query_listener is None:
+        slow_query_listener = SlowQueryListener(threshold_ms)
+    return slow_query_listener
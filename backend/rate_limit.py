@@ -0,0 +1,204 @@
+# backend/rate_limit.py
+"""
+Token-bucket rate limiting.
+
+`TokenBucketStore` keeps one (tokens, last_refill) pair per key in an LRU
+ordered dict, so every check is O(1) and memory is capped by `max_keys`
+(the least recently seen key is evicted first). `RateLimitMiddleware`
+applies per-route policies per client IP and, optionally, per account before
+the request reaches the route, so abusive bursts are shed with `429` and
+`Retry-After` before any bcrypt or Mongo work happens.
+"""
+
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.requests import cookie_parser
+
+from backend import config
+from backend.responses import FastJSONResponse
+
+MAX_ACCOUNT_BODY_BYTES = 64 * 1024  # larger bodies are never buffered to find the account
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: float           # burst size
+    refill_per_second: float
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Limit"]:
+        """'20/60' -> 20 requests per 60 seconds; empty or '0' disables the limit."""
+        spec = (spec or "").strip()
+        if not spec or spec == "0":
+            return None
+        count, _, period = spec.partition("/")
+        count, period = float(count), float(period or 1)
+        return cls(capacity=count, refill_per_second=count / period)
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    name: str
+    methods: FrozenSet[str]
+    paths: FrozenSet[str]
+    per_ip: Optional[Limit] = None
+    per_account: Optional[Limit] = None
+    # Where the account comes from: a form/JSON field name, or "authorization" for the
+    # bearer token (Authorization header, else the `access_token` cookie the HTML forms send)
+    account_from: Optional[str] = None
+
+
+class TokenBucketStore:
+    """Bounded LRU map of key -> [tokens, last_refill]."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, cost: float = 1.0) -> Tuple[bool, float]:
+        """Consume `cost` tokens; returns (allowed, seconds until enough tokens)."""
+        now = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [limit.capacity, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.refill_per_second)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, 0.0
+            return False, (cost - bucket[0]) / limit.refill_per_second
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def default_policies() -> List[RatePolicy]:
+    """Per-route policies; every limit is overridable through the RATE_LIMIT_* settings."""
+    login_ip = Limit.parse(config.RATE_LIMIT_LOGIN_IP)
+    login_account = Limit.parse(config.RATE_LIMIT_LOGIN_ACCOUNT)
+    return [
+        RatePolicy("login", frozenset({"POST"}), frozenset({"/login", "/api/login"}),
+                   per_ip=login_ip, per_account=login_account, account_from="username"),
+        RatePolicy("signup", frozenset({"POST"}), frozenset({"/signup"}),
+                   per_ip=Limit.parse(config.RATE_LIMIT_SIGNUP_IP)),
+        RatePolicy("password_reset", frozenset({"POST"}), frozenset({"/forgot-password", "/verify-otp"}),
+                   per_ip=Limit.parse(config.RATE_LIMIT_PASSWORD_RESET_IP)),
+        RatePolicy("shipment_writes", frozenset({"POST"}),
+                   frozenset({"/shipments", "/create-shipment", "/api/shipments/bulk"}),
+                   per_ip=Limit.parse(config.RATE_LIMIT_WRITES_IP),
+                   per_account=Limit.parse(config.RATE_LIMIT_WRITES_ACCOUNT), account_from="authorization"),
+    ]
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware; requests that match no policy pass straight through."""
+
+    def __init__(self, app, policies: Iterable[RatePolicy], store: Optional[TokenBucketStore] = None,
+                 trust_forwarded: bool = False):
+        self.app = app
+        self.store = store or TokenBucketStore()
+        self.trust_forwarded = trust_forwarded
+        self._routes: Dict[Tuple[str, str], RatePolicy] = {}
+        for policy in policies:
+            for method in policy.methods:
+                for path in policy.paths:
+                    self._routes[(method, path)] = policy
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        policy = self._routes.get((scope["method"], scope["path"]))
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        if policy.per_ip is not None:
+            allowed, retry_after = self.store.take(f"{policy.name}:ip:{self._client_ip(scope)}", policy.per_ip)
+            if not allowed:
+                return await self._reject(scope, receive, send, retry_after)
+
+        if policy.per_account is not None and policy.account_from:
+            account, receive = await self._account(scope, receive, policy.account_from)
+            if account:
+                allowed, retry_after = self.store.take(f"{policy.name}:acct:{account}", policy.per_account)
+                if not allowed:
+                    return await self._reject(scope, receive, send, retry_after)
+
+        await self.app(scope, receive, send)
+
+    def _client_ip(self, scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",", 1)[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def _account(self, scope, receive, source: str):
+        """Return (account key or None, receive callable that still yields the full body)."""
+        headers = dict(scope.get("headers", []))
+        if source == "authorization":
+            token = headers.get(b"authorization", b"").decode("latin-1")
+            token = token[7:] if token[:7].lower() == "bearer " else token
+            if not token:
+                token = cookie_parser(headers.get(b"cookie", b"").decode("latin-1")).get("access_token", "")
+            # Same JWT from either place -> same bucket; hashed so raw tokens never sit in memory as dict keys
+            return (hashlib.sha256(token.strip().encode()).hexdigest() if token.strip() else None), receive
+
+        length = headers.get(b"content-length")
+        if length is None or not length.isdigit() or int(length) > MAX_ACCOUNT_BODY_BYTES:
+            return None, receive
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                return None, receive
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        content_type = headers.get(b"content-type", b"").split(b";", 1)[0].strip()
+        value = None
+        try:
+            if content_type == b"application/x-www-form-urlencoded":
+                value = parse_qs(body.decode("utf-8")).get(source, [None])[0]
+            elif content_type == b"application/json":
+                data = json.loads(body)
+                value = data.get(source) if isinstance(data, dict) else None
+        except (UnicodeDecodeError, ValueError):
+            value = None
+        account = str(value).strip().lower() if value else None
+        return account, replay
+
+    @staticmethod
+    async def _reject(scope, receive, send, retry_after: float):
+        seconds = max(1, math.ceil(retry_after))
+        response = FastJSONResponse(
+            {"detail": "Too many requests. Please slow down."},
+            status_code=429,
+            headers={"Retry-After": str(seconds)},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,254 @@
+# backend/reading_buffer.py
+"""
+In-process ring buffer of the most recent readings per device.
+
+Each device gets one NumPy structured array of `capacity` fixed-width slots
+(timestamp, temperature, battery, interned route codes) written round-robin,
+so memory is bounded and no per-reading dicts are kept. Dicts are only built
+for the rows a request returns. A hit returns exactly the READING_FIELDS a
+Mongo read projected with READING_PROJECTION returns, at full precision.
+
+A background task subscribes to the Kafka topic (no consumer group, so every
+backend worker sees every reading) and appends as readings arrive; the
+buffer is then warmed from Mongo. Only while that subscription is live does
+`latest()` answer from memory; otherwise, and whenever a device holds fewer
+readings than asked for, it returns None and the caller reads Mongo.
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import orjson
+from starlette.concurrency import run_in_threadpool
+
+from backend.config import KAFKA_BROKER, KAFKA_TOPIC, READING_BUFFER_SIZE
+from backend.database import device_col
+
+logger = logging.getLogger("reading_buffer")
+
+# Fields of a reading served by the latest-readings API, whether from memory or Mongo
+READING_FIELDS = ("Device_ID", "timestamp", "First_Sensor_temperature", "Battery_Level", "Route_From", "Route_To")
+READING_PROJECTION = {"_id": 0, **{field: 1 for field in READING_FIELDS}}
+
+READING_DTYPE = np.dtype([
+    ("ts", "f8"),            # epoch seconds, UTC
+    ("temperature", "f8"),   # f8 so values round-trip exactly as stored in Mongo
+    ("battery", "f8"),
+    ("route_from", "u4"),    # codes into ReadingBuffer._strings
+    ("route_to", "u4"),
+])
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def _parse_ts(value) -> Optional[float]:
+    """Epoch seconds truncated to whole milliseconds, the precision Mongo stores."""
+    if isinstance(value, datetime):
+        ts = value
+    elif isinstance(value, str):
+        try:
+            ts = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    else:
+        return None
+    ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    # Integer arithmetic, so a Kafka µs timestamp and its Mongo copy map to the same float
+    return ((ts - EPOCH) // MILLISECOND) / 1000
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class _DeviceRing:
+    __slots__ = ("data", "pos", "count")
+
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity, dtype=READING_DTYPE)
+        self.pos = 0
+        self.count = 0
+
+
+class ReadingBuffer:
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self._rings: Dict[str, _DeviceRing] = {}
+        self._strings: List[str] = [""]
+        self._codes: Dict[str, int] = {"": 0}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.live = False
+        self.hits = 0
+        self.misses = 0
+
+    # ---------------------
+    # Writes
+    # ---------------------
+    def _code(self, value) -> int:
+        value = "" if value is None else str(value)
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._strings)
+            self._strings.append(value)
+        return code
+
+    def append(self, reading: Dict) -> bool:
+        device = reading.get("Device_ID")
+        ts = _parse_ts(reading.get("timestamp"))
+        if not device or ts is None:
+            return False
+        device = str(device)
+        with self._lock:
+            ring = self._rings.get(device)
+            if ring is None:
+                ring = self._rings[device] = _DeviceRing(self.capacity)
+            # Warm-up and the live feed overlap briefly; a reading is identified by its timestamp
+            if ring.count and (ring.data["ts"][:ring.count] == ts).any():
+                return False
+            ring.data[ring.pos] = (
+                ts,
+                _as_float(reading.get("First_Sensor_temperature")),
+                _as_float(reading.get("Battery_Level")),
+                self._code(reading.get("Route_From")),
+                self._code(reading.get("Route_To")),
+            )
+            ring.pos = (ring.pos + 1) % self.capacity
+            ring.count = min(ring.count + 1, self.capacity)
+        return True
+
+    # ---------------------
+    # Reads
+    # ---------------------
+    def latest(self, device: str, limit: int) -> Optional[List[Dict]]:
+        """The newest `limit` readings for `device`, newest first; None on a miss."""
+        with self._lock:
+            ring = self._rings.get(device)
+            if not self.live or limit > self.capacity or ring is None or ring.count < limit:
+                self.misses += 1
+                return None
+            valid = ring.data[:ring.count]
+            # Readings from different partitions can arrive slightly out of order
+            rows = valid[np.argsort(valid["ts"])[::-1][:limit]]
+            strings = self._strings
+            self.hits += 1
+        # Column-wise tolist() is far cheaper than touching NumPy scalars per row
+        temperatures = rows["temperature"].tolist()
+        batteries = rows["battery"].tolist()
+        return [
+            {
+                "Device_ID": device,
+                "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc),
+                "First_Sensor_temperature": None if temperature != temperature else temperature,
+                "Battery_Level": None if battery != battery else battery,
+                "Route_From": strings[route_from] or None,
+                "Route_To": strings[route_to] or None,
+            }
+            for ts, temperature, battery, route_from, route_to in zip(
+                rows["ts"].tolist(), temperatures, batteries, rows["route_from"].tolist(), rows["route_to"].tolist()
+            )
+        ]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            devices = len(self._rings)
+            readings = sum(ring.count for ring in self._rings.values())
+        total = self.hits + self.misses
+        return {
+            "live": self.live,
+            "devices": devices,
+            "readings": readings,
+            "capacity_per_device": self.capacity,
+            "bytes": devices * self.capacity * READING_DTYPE.itemsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+    # ---------------------
+    # Warm-up and Kafka subscription
+    # ---------------------
+    def warm(self, collection=device_col) -> int:
+        """Load the newest `capacity` readings of every device.
+
+        Both the device list and each per-device read walk the
+        (Device_ID, timestamp) index; nothing sorts the whole collection.
+        """
+        loaded = 0
+        for device in collection.distinct("Device_ID"):
+            if not device:
+                continue
+            docs = list(
+                collection.find({"Device_ID": device}, READING_PROJECTION)
+                .sort("timestamp", -1)
+                .limit(self.capacity)
+            )
+            # Oldest first, so the ring ends with the newest reading
+            for doc in reversed(docs):
+                loaded += self.append(doc)
+        logger.info(f"Reading buffer warmed with {loaded} readings")
+        return loaded
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        self.live = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        try:
+            from aiokafka import AIOKafkaConsumer
+        except ImportError:
+            logger.warning("aiokafka is not installed; reading buffer disabled")
+            return
+        delay = 1.0
+        while True:
+            consumer = AIOKafkaConsumer(
+                KAFKA_TOPIC,
+                bootstrap_servers=KAFKA_BROKER,
+                group_id=None,
+                auto_offset_reset="latest",
+                enable_auto_commit=False,
+            )
+            try:
+                await consumer.start()
+                # Subscribe before warming so the gap between the two stays as small as possible
+                await run_in_threadpool(self.warm)
+                self.live = True
+                delay = 1.0
+                async for msg in consumer:
+                    try:
+                        reading = orjson.loads(msg.value)
+                    except orjson.JSONDecodeError:
+                        continue
+                    if isinstance(reading, dict):
+                        self.append(reading)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Reading buffer subscription failed, retrying in {delay:.0f}s: {e}")
+            finally:
+                self.live = False
+                await consumer.stop()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+reading_buffer = ReadingBuffer(READING_BUFFER_SIZE)
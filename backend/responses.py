@@ -0,0 +1,39 @@
+# backend/responses.py
+"""
+orjson-backed JSON response used as the app-wide default.
+
+orjson serialises datetimes and NumPy arrays natively in C; Mongo's ObjectId
+(and Decimal128) are handled through `default`. Routes that return Mongo
+documents should return `FastJSONResponse(...)` directly: a plain dict return
+value still goes through FastAPI's `jsonable_encoder`, which walks every value
+in Python and does not know about ObjectId.
+"""
+
+from typing import Any
+
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
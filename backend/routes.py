@@ -1,34 +1,57 @@
 # backend/routes.py
-from fastapi import APIRouter, Request, Form, HTTPException, status, Depends, Response
+from fastapi import APIRouter, Request, Form, HTTPException, status, Depends, Response, Query, Header
 from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-from fastapi_mail import MessageSchema, FastMail
-from pathlib import Path
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta, timezone
 import re
+import itertools
 from jose import jwt
 import secrets
-import httpx
+import hmac
 from typing import Optional, Dict, List
-from time import time
 
 # --- Config & DB ---
-from backend.config import mail_conf, RECAPTCHA_SITE_KEY, RECAPTCHA_SECRET_KEY
-from backend.database import users_col, shipments_col, device_col, stream_col, hash_password, verify_password
-from backend.auth import create_access_token, get_current_user_email, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from backend.config import get_mail_conf, RECAPTCHA_SITE_KEY, RECAPTCHA_SECRET_KEY, PROFILE_TOKEN
+from backend.config import STREAM_LATEST_LIMIT, STREAM_MAX_POINTS, STREAM_MAX_RANGE_DAYS
+from backend import database
+from backend.database import users_col, shipments_col, device_col, alerts_col, route_stats_col, route_devices_col, hash_password, verify_password
+from backend.auth import create_access_token, get_current_user_email, token_cache, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from backend.device_index import device_route_index
+from backend.responses import FastJSONResponse
+from backend.rate_limit import Limit, TokenBucketStore
+from backend.cache import query_cache
+from backend.archive import segment_store
+from backend import profiling
+from backend.concurrency import heavy_route_limiters
+from backend.summary import record_shipments, get_summary, summary_version
+from backend.templating import render_template, render_stats, fragment_cache
+from backend.downsample import downsample_stream
+from backend.reading_buffer import READING_FIELDS, READING_PROJECTION, reading_buffer
+from backend.bulk_import import (
+    BulkImportError, DEFAULT_BATCH_SIZE, DEFAULT_MAX_ERRORS, MAX_BATCH_SIZE, MAX_REPORTED_ERRORS,
+    detect_format, import_shipments, insert_batch, iter_csv_rows, iter_lines, iter_ndjson_rows,
+)
 
 # --- Global instances ---
-fm = FastMail(mail_conf)
+_mailer = None
 
 # ✅ OTP store — in-memory (replace with Redis in prod)
 otp_store: Dict[str, Dict] = {}
 
-# ✅ Rate limiter: email → list of timestamps (last 10 min only)
-otp_request_log: Dict[str, List[float]] = {}
+# ✅ Rate limiter: email → token bucket (burst of 3 OTP requests, then 1 per 10 minutes)
+otp_limiter = TokenBucketStore(max_keys=10_000)
+OTP_LIMIT = Limit(capacity=3, refill_per_second=1 / 600)
 
-BASE_DIR = Path(__file__).resolve().parent.parent
-app = APIRouter()
-templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+app = APIRouter(route_class=profiling.ProfiledRoute)
+
+
+def get_mailer():
+    # fastapi_mail (and its SMTP stack) is only imported once a mail is actually sent
+    global _mailer
+    if _mailer is None:
+        from fastapi_mail import FastMail
+        _mailer = FastMail(get_mail_conf())
+    return _mailer
 
 
 # ---------------------
@@ -39,7 +62,7 @@ def get_user_from_cookies(request: Request) -> Optional[Dict]:
     if not token:
         return None
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_cache.decode(token)
         email = payload.get("email")
         if not email:
             return None
@@ -48,8 +71,93 @@ def get_user_from_cookies(request: Request) -> Optional[Dict]:
         return None
 
 
-def render_template(template: str, ctx: dict, status_code: int = 200) -> HTMLResponse:
-    return templates.TemplateResponse(template, ctx, status_code=status_code)
+def with_archive_fallback(docs: List[Dict], device: str, limit: int) -> List[Dict]:
+    """Top up a newest-first result from archived segments when the hot collection runs short."""
+    if len(docs) >= limit or not segment_store.has_segments:
+        return docs
+    oldest = docs[-1].get("timestamp") if docs else None
+    if isinstance(oldest, datetime) and oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    end = oldest if isinstance(oldest, datetime) else None
+    return docs + segment_store.read(device, end=end, limit=limit - len(docs))
+
+
+def _as_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    return ts.replace(tzinfo=timezone.utc) if ts is not None and ts.tzinfo is None else ts
+
+
+def _latest_from_mongo(device: str, limit: int = STREAM_LATEST_LIMIT) -> List[Dict]:
+    # Same fields and UTC timestamps as a reading_buffer hit, so both paths return one shape
+    docs = list(device_col.find({"Device_ID": device}, READING_PROJECTION).sort("timestamp", -1).limit(limit))
+    docs = [{field: doc[field] for field in READING_FIELDS if field in doc}
+            for doc in with_archive_fallback(docs, device, limit)]
+    for doc in docs:
+        if isinstance(doc.get("timestamp"), datetime):
+            doc["timestamp"] = _as_utc(doc["timestamp"])
+    return docs
+
+
+def latest_readings(device: str, limit: int = STREAM_LATEST_LIMIT) -> List[Dict]:
+    """The newest `limit` readings for `device`, newest first (memory first, then Mongo)."""
+    docs = reading_buffer.latest(device, limit)
+    return docs if docs is not None else _latest_from_mongo(device, limit)
+
+
+def readings_in_range(device: str, start: Optional[datetime], end: Optional[datetime],
+                      max_points: int = STREAM_MAX_POINTS, field: str = "First_Sensor_temperature") -> Dict:
+    """
+    Readings for `device` in [start, end), oldest first, LTTB-downsampled to `max_points`.
+
+    `end` defaults to now and `start` to one day before `end`. The part of the
+    range that has been archived is read from segment files.
+    """
+    end = _as_utc(end) or datetime.now(timezone.utc)
+    start = _as_utc(start) or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be earlier than 'to'.")
+    if end - start > timedelta(days=STREAM_MAX_RANGE_DAYS):
+        raise HTTPException(status_code=400, detail=f"Time range is limited to {STREAM_MAX_RANGE_DAYS:g} days.")
+    max_points = max(3, min(max_points, STREAM_MAX_POINTS))
+    if not field or field.startswith("$"):
+        raise HTTPException(status_code=400, detail=f"Invalid field: {field!r}")
+    fields = READING_FIELDS if field in READING_FIELDS else (*READING_FIELDS, field)
+
+    query = {"Device_ID": device, "timestamp": {"$gte": start, "$lt": end}}
+    archived: List[Dict] = []
+    if segment_store.has_segments:
+        # Archived readings are older than anything still in the hot collection
+        first = device_col.find_one(query, {"_id": 0, "timestamp": 1}, sort=[("timestamp", 1)])
+        hot_start = _as_utc(first["timestamp"]) if first else end
+        if hot_start > start:
+            archived = segment_store.read(device, start=start, end=hot_start)[::-1]
+    cursor = (
+        device_col.find(query, {"_id": 0, **{name: 1 for name in fields}})
+        .sort("timestamp", 1)
+        .batch_size(10_000)
+    )
+    raw_points, stream_data = downsample_stream(itertools.chain(archived, cursor), field, max_points, fields)
+    return {
+        "device": device,
+        "from": start,
+        "to": end,
+        "raw_points": raw_points,
+        "stream_data": stream_data,
+    }
+
+
+# ---------------------
+# Health probes
+# ---------------------
+@app.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+def readiness():
+    mongo = database.ping()
+    body = {"status": "ready" if mongo["ok"] else "unavailable", "mongo": mongo}
+    return JSONResponse(body, status_code=200 if mongo["ok"] else 503)
 
 
 # ---------------------
@@ -129,6 +237,8 @@ async def signup(
         if not g_recaptcha_response:
             errors.append("reCAPTCHA failed")
         else:
+            import httpx
+
             async with httpx.AsyncClient() as client:
                 # ✅ FIXED: removed trailing spaces in URL
                 resp = await client.post(
@@ -177,9 +287,8 @@ async def forgot_password(request: Request, email: str = Form(...)):
     email = email.strip().lower()
 
     # ✅ Rate limiting: max 3 requests per 10 minutes per email
-    now = time()
-    otp_request_log[email] = [t for t in otp_request_log.get(email, []) if now - t < 600]  # keep last 10 min
-    if len(otp_request_log[email]) >= 3:
+    allowed, _ = otp_limiter.take(email, OTP_LIMIT)
+    if not allowed:
         return render_template("forgot-password.html", {
             "request": request,
             "error": "Too many requests. Please try again in 10 minutes."
@@ -199,17 +308,18 @@ async def forgot_password(request: Request, email: str = Form(...)):
 
     # Store
     otp_store[email] = {"otp": otp, "expires_at": expires_at}
-    otp_request_log[email].append(now)
 
     # Send email
     try:
+        from fastapi_mail import MessageSchema
+
         message = MessageSchema(
             subject="ShipTrack — Password Reset OTP",
             recipients=[email],
             body=f"Your ShipTrack password reset code is:\n\n{otp}\n\nValid for 10 minutes.",
             subtype="plain"
         )
-        await fm.send_message(message)  # ✅ reuse global `fm`
+        await get_mailer().send_message(message)  # ✅ reuse one FastMail instance
     except Exception as e:
         print("📧 Email send failed:", e)
         return render_template("forgot-password.html", {
@@ -323,7 +433,11 @@ def dashboard(request: Request):
     user = get_user_from_cookies(request)
     if not user:
         return RedirectResponse("/login")
-    return render_template("dashboard.html", {"request": request, "username": user.get("username")})
+    return render_template("dashboard.html", {
+        "request": request,
+        "username": user.get("username"),
+        "summary": get_summary(user["email"]),
+    })
 
 
 @app.get("/profile", response_class=HTMLResponse)
@@ -351,11 +465,8 @@ def profile_data(request: Request):
     }
 
 
-@app.get("/devices", response_class=HTMLResponse)
-def devices_page(request: Request):
-    user = get_user_from_cookies(request)
-    if not user:
-        return RedirectResponse("/login")
+def latest_device_readings() -> List[Dict]:
+    """Latest reading per device joined with its shipment route; shared via `query_cache`."""
     pipeline = [
         {"$sort": {"timestamp": -1}},
         {"$group": {"_id": "$Device_ID", "latest": {"$first": "$$ROOT"}}},
@@ -363,10 +474,7 @@ def devices_page(request: Request):
     ]
     device_readings = list(device_col.aggregate(pipeline))
     device_ids = [d["Device_ID"] for d in device_readings if d.get("Device_ID")]
-    shipments = list(shipments_col.find({"Device": {"$in": device_ids}}, {
-        "Device": 1, "Route_From": 1, "Route_To": 1, "_id": 0
-    }))
-    route_map = {s["Device"]: {"Route_From": s.get("Route_From", "—"), "Route_To": s.get("Route_To", "—")} for s in shipments}
+    route_map = device_route_index.routes_for(device_ids)
     for d in device_readings:
         dev_id = d.get("Device_ID")
         if dev_id in route_map:
@@ -374,7 +482,20 @@ def devices_page(request: Request):
         else:
             d.setdefault("Route_From", "—")
             d.setdefault("Route_To", "—")
-    return render_template("devices.html", {"request": request, "devices": device_readings})
+    return device_readings
+
+
+@app.get("/devices", response_class=HTMLResponse)
+def devices_page(request: Request):
+    user = get_user_from_cookies(request)
+    if not user:
+        return RedirectResponse("/login")
+    device_readings = query_cache.get_or_compute("devices:latest", latest_device_readings)
+    # Rows only change when a device reports or its route changes
+    version = (device_route_index.version,
+               tuple((d.get("Device_ID"), d.get("timestamp")) for d in device_readings))
+    device_rows = fragment_cache.render("partials/device_rows.html", version, {"devices": device_readings})
+    return render_template("devices.html", {"request": request, "device_rows": device_rows})
 
 
 @app.get("/my-shipments", response_class=HTMLResponse)
@@ -392,12 +513,18 @@ def my_shipments_page(request: Request):
             {"Device": {"$regex": query_param, "$options": "i"}},
             {"_id": {"$regex": query_param, "$options": "i"}}
         ]
-    shipments = list(shipments_col.find(db_query, {"_id": 0}))
+    # The user's summary changes on every shipment write, so on a hit the shipments are not even fetched
+    version = summary_version(email)
+    shipment_rows = fragment_cache.render(
+        "partials/shipment_rows.html",
+        (email, query_param, version) if version is not None else None,
+        lambda: {"shipments": list(shipments_col.find(db_query, {"_id": 0}))},
+    )
     return render_template("my_shipments.html", {
         "request": request,
         "username": user.get("username"),
         "email": email,
-        "shipments": shipments,
+        "shipment_rows": shipment_rows,
         "search_query": query_param
     })
 
@@ -407,17 +534,16 @@ def view_stream_page(request: Request):
     user = get_user_from_cookies(request)
     if not user:
         return RedirectResponse("/login")
-    devices = list(shipments_col.find({}, {"_id": 0, "Device": 1}))
-    device_list = sorted({d.get("Device") for d in devices if d.get("Device")})
+    device_list = device_route_index.devices()
     selected_device = request.query_params.get("device", "").strip()
     stream_data = []
     if selected_device:
-        stream_data = list(device_col.find({"Device_ID": selected_device}).sort("timestamp", -1).limit(50))
-        for doc in stream_data:
-            if "_id" in doc:
-                doc["_id"] = str(doc["_id"])
-            if isinstance(doc.get("timestamp"), datetime):
-                doc["timestamp"] = doc["timestamp"].isoformat()
+        start = _parse_query_datetime(request.query_params.get("from"))
+        end = _parse_query_datetime(request.query_params.get("to"))
+        if start is None and end is None:
+            stream_data = latest_readings(selected_device)
+        else:
+            stream_data = readings_in_range(selected_device, start, end)["stream_data"]
     return render_template("view_stream.html", {
         "request": request,
         "devices": device_list,
@@ -426,14 +552,31 @@ def view_stream_page(request: Request):
     })
 
 
+def _parse_query_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid datetime: {value!r}")
+
+
 @app.get("/api/stream/{device}")
-async def get_device_stream_api(device: str, email: str = Depends(get_current_user_email)):
-    stream_docs = list(stream_col.find({"device": device}).sort("timestamp", -1).limit(50))
-    for doc in stream_docs:
-        doc["_id"] = str(doc["_id"])
-        if isinstance(doc.get("timestamp"), datetime):
-            doc["timestamp"] = doc["timestamp"].isoformat()
-    return {"device": device, "stream_data": stream_docs}
+async def get_device_stream_api(
+    device: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    max_points: int = STREAM_MAX_POINTS,
+    field: str = "First_Sensor_temperature",
+    email: str = Depends(get_current_user_email)
+):
+    # Without a range this stays the "latest readings" feed; with one it is a downsampled window
+    if start is None and end is None:
+        stream_docs = reading_buffer.latest(device, STREAM_LATEST_LIMIT)
+        if stream_docs is None:
+            stream_docs = await run_in_threadpool(_latest_from_mongo, device)
+        return FastJSONResponse({"device": device, "stream_data": stream_docs})
+    return FastJSONResponse(await run_in_threadpool(readings_in_range, device, start, end, max_points, field))
 
 
 @app.get("/device-stream/{device_id}", response_class=HTMLResponse)
@@ -441,7 +584,7 @@ def device_stream_page(request: Request, device_id: str):
     user = get_user_from_cookies(request)
     if not user:
         return RedirectResponse("/login")
-    device_doc = shipments_col.find_one({"Device": device_id}, {"_id": 0}) or {}
+    device_doc = device_route_index.get(device_id) or {}
     return render_template("device_stream.html", {
         "request": request,
         "device": device_doc,
@@ -485,6 +628,8 @@ async def create_shipment_handler(request: Request):
     shipment = {k: v for k, v in form.items() if k not in {"captcha_answer", "captcha_token"}}
     shipment.update({"created_by_email": user["email"], "created_at": datetime.now(timezone.utc)})
     shipments_col.insert_one(shipment)
+    device_route_index.apply(shipment)
+    record_shipments(user["email"], [shipment])
     return RedirectResponse("/my-shipments", status_code=303)
 
 
@@ -496,19 +641,154 @@ async def create_shipment_json_api(request: Request, email: str = Depends(get_cu
         data = dict(await request.form())
     data.update({"created_by_email": email, "created_at": datetime.now(timezone.utc)})
     result = shipments_col.insert_one(data)
-    return JSONResponse({"id": str(result.inserted_id)}, status_code=201)
+    device_route_index.apply(data)
+    record_shipments(email, [data])
+    return FastJSONResponse({"id": result.inserted_id}, status_code=201)
+
+
+def _insert_shipment_batch(docs: List[Dict]):
+    inserted, failures = insert_batch(shipments_col, docs)
+    stored = [doc for i, doc in enumerate(docs) if i not in failures]
+    device_route_index.apply_many(stored)
+    if stored:
+        record_shipments(stored[0]["created_by_email"], stored)
+    return inserted, failures
+
+
+@app.post("/api/shipments/bulk")
+async def bulk_import_shipments_api(
+    request: Request,
+    format: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_errors: int = DEFAULT_MAX_ERRORS,
+    email: str = Depends(get_current_user_email)
+):
+    try:
+        fmt = detect_format(request.headers.get("content-type", ""), format)
+    except BulkImportError as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {MAX_BATCH_SIZE}.")
+
+    lines = iter_lines(request.stream())
+    rows = iter_csv_rows(lines) if fmt == "csv" else iter_ndjson_rows(lines)
+    report = await import_shipments(
+        rows,
+        lambda docs: run_in_threadpool(_insert_shipment_batch, docs),
+        created_by_email=email,
+        batch_size=batch_size,
+        max_errors=min(max(0, max_errors), MAX_REPORTED_ERRORS),
+    )
+    if report.write_failed:
+        status_code = 503
+    elif report.aborted:
+        status_code = 400
+    else:
+        status_code = 200 if report.failed == 0 else 207
+    return FastJSONResponse(report.as_dict(), status_code=status_code)
+
+
+@app.get("/api/summary")
+async def get_summary_api(email: str = Depends(get_current_user_email)):
+    return FastJSONResponse(await run_in_threadpool(get_summary, email))
 
 
 @app.get("/api/devices")
 async def get_devices_api(email: str = Depends(get_current_user_email)):
     devices = list(shipments_col.find({}, {"_id": 0}))
-    return {"devices": devices}
+    return FastJSONResponse({"devices": devices})
+
+
+@app.get("/api/alerts")
+async def get_alerts_api(
+    alert_status: str = Query("active", alias="status"),
+    device: Optional[str] = None,
+    limit: int = 100,
+    email: str = Depends(get_current_user_email)
+):
+    query = {}
+    if alert_status != "all":
+        query["status"] = alert_status
+    if device:
+        query["device"] = device
+    alerts = list(alerts_col.find(query, {"_id": 0}).sort("opened_at", -1).limit(max(1, min(limit, 1000))))
+    return FastJSONResponse({"alerts": alerts})
+
+
+@app.get("/api/routes/stats")
+async def get_route_stats_api(active_minutes: int = 15, email: str = Depends(get_current_user_email)):
+    # One pre-aggregated document per lane, maintained by the Kafka consumer
+    active_since = datetime.now(timezone.utc) - timedelta(minutes=max(1, active_minutes))
+    # Device counts come from the (lane, device) last-seen collection: the active count is a
+    # range scan on the last_seen index, the total a covered scan of the (route, last_seen) one
+    active = {
+        group["_id"]: group["count"] for group in route_devices_col.aggregate([
+            {"$match": {"last_seen": {"$gte": active_since}}},
+            {"$group": {"_id": "$route", "count": {"$sum": 1}}},
+        ])
+    }
+    total = {
+        group["_id"]: group["count"] for group in route_devices_col.aggregate([
+            {"$sort": {"route": 1}},
+            {"$project": {"_id": 0, "route": 1}},
+            {"$group": {"_id": "$route", "count": {"$sum": 1}}},
+        ])
+    }
+    routes = []
+    for doc in route_stats_col.find({}, {"devices": 0}):
+        temp_count = doc.get("temperature_count") or 0
+        routes.append({
+            "Route_From": doc.get("Route_From"),
+            "Route_To": doc.get("Route_To"),
+            "reading_count": doc.get("reading_count", 0),
+            "avg_temperature": round(doc.get("temperature_sum", 0.0) / temp_count, 2) if temp_count else None,
+            "max_temperature": doc.get("max_temperature"),
+            "min_battery": doc.get("min_battery"),
+            "active_devices": active.get(doc["_id"], 0),
+            "total_devices": total.get(doc["_id"], 0),
+            "last_seen": doc.get("last_seen"),
+        })
+    return FastJSONResponse({"routes": routes, "active_minutes": active_minutes})
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats_api(email: str = Depends(get_current_user_email)):
+    return {
+        "query_cache": query_cache.stats(),
+        "reading_buffer": reading_buffer.stats(),
+        "token_cache": token_cache.stats(),
+    }
+
+
+def require_admin_token(x_profile: Optional[str] = Header(None)) -> None:
+    # Same admin secret that enables on-demand profiling
+    if not PROFILE_TOKEN or not x_profile or not hmac.compare_digest(x_profile, PROFILE_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+
+@app.get("/api/admin/slow-queries", dependencies=[Depends(require_admin_token)])
+async def get_slow_queries_api():
+    listener = profiling.slow_query_listener
+    return FastJSONResponse({
+        "threshold_ms": listener.threshold_us / 1000 if listener else None,  # None until Mongo is first used or when disabled
+        "slow_queries": listener.recent() if listener else [],
+    })
+
+
+@app.get("/api/admin/concurrency", dependencies=[Depends(require_admin_token)])
+async def get_concurrency_stats_api():
+    return {"routes": {path: limiter.stats() for path, limiter in heavy_route_limiters.items()}}
+
+
+@app.get("/api/admin/templates", dependencies=[Depends(require_admin_token)])
+async def get_template_stats_api():
+    return {"renders": render_stats.snapshot(), "fragment_cache": fragment_cache.stats()}
 
 
 @app.get("/api/my-shipments")
 async def get_my_shipments_api(email: str = Depends(get_current_user_email)):
     shipments = list(shipments_col.find({"created_by_email": email}, {"_id": 0}))
-    return {"shipments": shipments}
+    return FastJSONResponse({"shipments": shipments})
 
 
 @app.post("/api/login")
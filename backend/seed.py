@@ -0,0 +1,222 @@
+# backend/seed.py
+"""
+Synthetic dataset seeder for load tests and capacity planning.
+
+    python -m backend.seed                      # scale 0.01: 10 users, 100 shipments, 100k readings
+    python -m backend.seed --scale 1            # 1k users, 10k shipments, 10M readings
+    python -m backend.seed --scale 1 --workers 16 --batch-size 20000
+    python -m backend.seed --clean              # delete everything a previous run seeded
+
+At scale 1 there are 1,000 users, 10 shipments per user, one tracking device
+per shipment, and 1,000 readings per device at READING_INTERVAL seconds
+apart, ending now. Shipments follow the `Shipment` model. Every seeded user
+shares one password, hashed once with bcrypt up front. Readings are
+generated per device as NumPy arrays: temperature is a daily cycle plus a
+random walk, and battery drains with noise.
+
+Work is split into chunks that worker processes generate and write with
+unordered `insert_many` batches, so generation and Mongo writes run in
+parallel. Seeded rows are recognisable (`@seed.example.com` emails,
+`SEED-` shipment numbers and device IDs), so `--clean` removes exactly them.
+"""
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from backend.database import device_col, hash_password, shipments_col, users_col
+
+USERS_PER_SCALE = 1_000
+SHIPMENTS_PER_USER = 10
+READINGS_PER_DEVICE = 1_000
+READING_INTERVAL = 10.0  # seconds, same cadence as the producer
+
+EMAIL_DOMAIN = "seed.example.com"
+SEED_PREFIX = "SEED-"
+
+CITIES = [
+    "New York, USA", "Chennai, India", "Bengaluru, India", "London, UK", "Rotterdam, Netherlands",
+    "Singapore", "Dubai, UAE", "Hamburg, Germany", "Shanghai, China", "Los Angeles, USA",
+]
+GOODS_TYPES = ["Pharmaceuticals", "Vaccines", "Frozen Food", "Electronics", "Chemicals", "Produce"]
+
+_KINDS = {"users": 0, "shipments": 1, "readings": 2}
+
+
+def _rng(seed: int, kind: str, chunk: int) -> np.random.Generator:
+    # Independent, reproducible stream per chunk whatever the worker count
+    return np.random.default_rng([seed, _KINDS[kind], chunk])
+
+
+def _route(device_index: int, seed: int) -> Tuple[str, str]:
+    rng = np.random.default_rng([seed, 99, device_index])
+    origin, destination = rng.choice(len(CITIES), size=2, replace=False)
+    return CITIES[origin], CITIES[destination]
+
+
+def _insert(collection, docs: List[Dict], batch_size: int) -> int:
+    for start in range(0, len(docs), batch_size):
+        collection.insert_many(docs[start:start + batch_size], ordered=False, bypass_document_validation=True)
+    return len(docs)
+
+
+# ---------------------
+# Generators (run in worker processes)
+# ---------------------
+def seed_users(chunk: int, start: int, count: int, password_hash: str, seed: int, batch_size: int) -> int:
+    rng = _rng(seed, "users", chunk)
+    now = datetime.now(timezone.utc)
+    ages = rng.integers(0, 365 * 24 * 3600, size=count).tolist()
+    docs = [
+        {
+            "username": f"seed_user_{i}",
+            "email": f"user{i}@{EMAIL_DOMAIN}",
+            "password_hash": password_hash,
+            "created_at": now - timedelta(seconds=age),
+        }
+        for i, age in zip(range(start, start + count), ages)
+    ]
+    return _insert(users_col, docs, batch_size)
+
+
+def seed_shipments(chunk: int, start: int, count: int, users: int, seed: int, batch_size: int) -> int:
+    rng = _rng(seed, "shipments", chunk)
+    now = datetime.now(timezone.utc)
+    delivery_hours = rng.integers(-30 * 24, 30 * 24, size=count).tolist()
+    created_hours = rng.integers(1, 60 * 24, size=count).tolist()
+    goods = rng.integers(0, len(GOODS_TYPES), size=count).tolist()
+    codes = rng.integers(10**7, 10**8, size=(count, 5)).tolist()
+    docs = []
+    for offset in range(count):
+        i = start + offset
+        origin, destination = _route(i, seed)
+        po, ndc, serial, container, delivery = codes[offset]
+        docs.append({
+            "Shipment_Number": f"{SEED_PREFIX}SHP-{i:08d}",
+            "Route_Details": f"{origin} -> {destination}",
+            "Device": f"{SEED_PREFIX}D{i:08d}",
+            "Po_Number": f"PO{po}",
+            "NDC_Number": f"NDC{ndc}",
+            "Serial_Number_of_Goods": f"SN{serial}",
+            "Container_number": f"CONT{container}",
+            "Goods_Type": GOODS_TYPES[goods[offset]],
+            "Expected_Delivery_Date": now + timedelta(hours=delivery_hours[offset]),
+            "delivery_number": f"DN{delivery}",
+            "Batch_ID": f"B{i // 100:06d}",
+            "Shipment_Description": f"Seeded {GOODS_TYPES[goods[offset]].lower()} shipment",
+            "created_by_email": f"user{i % users}@{EMAIL_DOMAIN}",
+            "created_at": now - timedelta(hours=created_hours[offset]),
+        })
+    return _insert(shipments_col, docs, batch_size)
+
+
+def seed_readings(chunk: int, device_start: int, device_count: int, per_device: int,
+                  seed: int, batch_size: int) -> int:
+    rng = _rng(seed, "readings", chunk)
+    end = datetime.now(timezone.utc).timestamp()
+    steps = np.arange(per_device, dtype=np.float64)
+    written = 0
+    for device_index in range(device_start, device_start + device_count):
+        device = f"{SEED_PREFIX}D{device_index:08d}"
+        origin, destination = _route(device_index, seed)
+
+        ts = end - (per_device - 1 - steps) * READING_INTERVAL + rng.uniform(-1, 1, per_device)
+        daily = 3.0 * np.sin(2 * np.pi * ts / 86_400 + rng.uniform(0, 2 * np.pi))
+        walk = np.cumsum(rng.normal(0, 0.05, per_device))
+        temperature = np.clip(rng.uniform(15, 30) + daily + walk, 10.0, 40.0).round(1)
+        drain = np.linspace(rng.uniform(4.2, 5.0), rng.uniform(2.0, 3.5), per_device)
+        battery = np.clip(drain + rng.normal(0, 0.02, per_device), 2.0, 5.0).round(2)
+
+        docs = [
+            {
+                "Device_ID": device,
+                "Battery_Level": b,
+                "First_Sensor_temperature": t,
+                "Route_From": origin,
+                "Route_To": destination,
+                "timestamp": datetime.fromtimestamp(s, tz=timezone.utc),
+            }
+            for s, t, b in zip(ts.tolist(), temperature.tolist(), battery.tolist())
+        ]
+        written += _insert(device_col, docs, batch_size)
+    return written
+
+
+# ---------------------
+# Driver
+# ---------------------
+def _chunks(total: int, size: int):
+    for index, start in enumerate(range(0, total, size)):
+        yield index, start, min(size, total - start)
+
+
+def clean() -> None:
+    users = users_col.delete_many({"email": {"$regex": f"@{EMAIL_DOMAIN}$"}}).deleted_count
+    shipments = shipments_col.delete_many({"Shipment_Number": {"$regex": f"^{SEED_PREFIX}"}}).deleted_count
+    readings = device_col.delete_many({"Device_ID": {"$regex": f"^{SEED_PREFIX}"}}).deleted_count
+    print(f"Removed {users} users, {shipments} shipments, {readings} readings")
+
+
+def run(scale: float, workers: int, batch_size: int, password: str, seed: int) -> None:
+    users = max(1, round(USERS_PER_SCALE * scale))
+    shipments = users * SHIPMENTS_PER_USER
+    per_device = READINGS_PER_DEVICE
+    readings = shipments * per_device
+    print(f"Seeding {users:,} users, {shipments:,} shipments, {readings:,} readings with {workers} workers")
+
+    password_hash = hash_password(password)  # once; bcrypt is deliberately slow
+    # Devices per readings task, so each task writes roughly `batch_size * 4` documents
+    devices_per_task = max(1, batch_size * 4 // per_device)
+
+    # "spawn" gives every worker its own Mongo client instead of a forked copy of ours
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {}
+        for chunk, start, count in _chunks(users, batch_size):
+            futures[pool.submit(seed_users, chunk, start, count, password_hash, seed, batch_size)] = "users"
+        for chunk, start, count in _chunks(shipments, batch_size):
+            futures[pool.submit(seed_shipments, chunk, start, count, users, seed, batch_size)] = "shipments"
+        for chunk, start, count in _chunks(shipments, devices_per_task):
+            futures[pool.submit(seed_readings, chunk, start, count, per_device, seed, batch_size)] = "readings"
+
+        totals = {"users": 0, "shipments": 0, "readings": 0}
+        for future in as_completed(futures):
+            totals[futures[future]] += future.result()
+            if futures[future] == "readings":
+                elapsed = time.perf_counter() - started
+                print(f"  {totals['readings']:,}/{readings:,} readings "
+                      f"({totals['readings'] / elapsed:,.0f}/s)", end="\r", flush=True)
+
+    elapsed = time.perf_counter() - started
+    print(f"\nInserted {totals['users']:,} users, {totals['shipments']:,} shipments and "
+          f"{totals['readings']:,} readings in {elapsed:.1f}s")
+
+    # Built once after the load instead of being maintained during it
+    device_col.create_index([("Device_ID", 1), ("timestamp", 1)])
+    from backend.summary import reconcile
+    reconcile()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=0.01, help="1.0 = 1k users, 10k shipments, 10M readings")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=10_000, help="documents per insert_many")
+    parser.add_argument("--password", default="Password@123", help="password shared by every seeded user")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (same seed, same data)")
+    parser.add_argument("--clean", action="store_true", help="delete previously seeded data and exit")
+    args = parser.parse_args()
+    if args.clean:
+        clean()
+        return
+    run(args.scale, args.workers, args.batch_size, args.password, args.seed)
+
+
+if __name__ == "__main__":
+    main()
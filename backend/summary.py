@@ -0,0 +1,290 @@
+# backend/summary.py
+"""
+Precomputed per-user shipment summary.
+
+One small document per user (`_id` = email) is updated with a single atomic
+`update_one` whenever that user's shipments are inserted, so the dashboard
+and `/api/summary` read one document instead of counting over shipments.
+Undelivered shipments are counted in per-day buckets (`due_days`, keyed by
+UTC date) for the next DUE_HORIZON_DAYS, and in a single `due_later` counter
+beyond that, so the document stays small however many shipments a user has.
+`in_transit` is the sum of the buckets from today on, computed at read time;
+a shipment due today counts as in transit until the end of its UTC day.
+`upcoming` holds UPCOMING_LIMIT entries; entries whose date has passed are
+dropped at read time, so the list can run short until the next
+reconciliation.
+
+A periodic reconciliation rebuilds every summary from the shipments
+collection to correct drift (failed updates, deleted shipments, passed due
+dates). Only the worker holding a lease in the locks collection runs it,
+and a summary updated after the pass started is left alone so a concurrent
+`record_shipments` is never overwritten.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from backend.config import SUMMARY_RECONCILE_SECONDS
+from backend.database import locks_col, shipments_col, summaries_col
+
+logger = logging.getLogger("summary")
+
+UPCOMING_LIMIT = 5
+DUE_HORIZON_DAYS = 90  # per-day buckets up to this far ahead, one counter beyond
+LEASE_ID = "summary-reconciler"
+DUPLICATE_KEY = 11000
+
+
+def parse_delivery_date(value) -> Optional[datetime]:
+    """Expected_Delivery_Date arrives as a datetime (bulk API) or an HTML datetime-local string."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str) and value.strip():
+        try:
+            parsed = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return None
+
+
+def _upcoming_entry(doc: Dict, due: datetime) -> Dict:
+    return {
+        "Shipment_Number": doc.get("Shipment_Number"),
+        "Device": doc.get("Device"),
+        "Expected_Delivery_Date": due,
+    }
+
+
+def _due_key(due: datetime, now: datetime) -> Optional[str]:
+    """`due_days` bucket for a future due date, None when it is beyond the horizon."""
+    if due - now > timedelta(days=DUE_HORIZON_DAYS):
+        return None
+    return due.astimezone(timezone.utc).date().isoformat()
+
+
+def record_shipments(email: str, docs: Iterable[Dict]) -> None:
+    """
+    Fold newly inserted shipments into the owner's summary (one atomic upsert).
+
+    The shipments are already stored, so a failed update is logged rather than
+    raised; the next reconciliation pass repairs the summary.
+    """
+    now = datetime.now(timezone.utc)
+    total = 0
+    due_counts: Dict[str, int] = {}
+    upcoming: List[Dict] = []
+    last_created_at = None
+    for doc in docs:
+        total += 1
+        due = parse_delivery_date(doc.get("Expected_Delivery_Date"))
+        if due is not None and due > now:
+            day = _due_key(due, now)
+            field = f"due_days.{day}" if day else "due_later"
+            due_counts[field] = due_counts.get(field, 0) + 1
+            upcoming.append(_upcoming_entry(doc, due))
+        created_at = doc.get("created_at")
+        if isinstance(created_at, datetime) and (last_created_at is None or created_at > last_created_at):
+            last_created_at = created_at
+    if not total:
+        return
+    upcoming.sort(key=lambda entry: entry["Expected_Delivery_Date"])
+    update = {
+        "$inc": {"total_shipments": total, **due_counts},
+        "$set": {"updated_at": now},
+        "$max": {"last_created_at": last_created_at or now},
+    }
+    if upcoming:
+        update["$push"] = {"upcoming": {
+            "$each": upcoming[:UPCOMING_LIMIT],
+            "$sort": {"Expected_Delivery_Date": 1},
+            "$slice": UPCOMING_LIMIT,
+        }}
+    try:
+        summaries_col.update_one({"_id": email}, update, upsert=True)
+    except PyMongoError as e:
+        logger.warning(f"Summary update for {email} failed, left to reconciliation: {e}")
+
+
+def get_summary(email: str) -> Dict:
+    doc = summaries_col.find_one({"_id": email}) or {}
+    now = datetime.now(timezone.utc)
+    # ISO dates sort as strings; buckets before today are stale until reconciliation drops them
+    today = now.date().isoformat()
+    in_transit = doc.get("due_later", 0) + sum(
+        count for day, count in doc.get("due_days", {}).items() if day >= today
+    )
+    upcoming = []
+    for entry in doc.get("upcoming", []):
+        due = parse_delivery_date(entry.get("Expected_Delivery_Date"))
+        if due is not None and due > now:
+            upcoming.append({**entry, "Expected_Delivery_Date": due})
+    return {
+        "total_shipments": doc.get("total_shipments", 0),
+        "in_transit": in_transit,
+        "upcoming": upcoming,
+        "last_created_at": doc.get("last_created_at"),
+        "updated_at": doc.get("updated_at"),
+        "reconciled_at": doc.get("reconciled_at"),
+    }
+
+
+def summary_version(email: str) -> Optional[tuple]:
+    """Changes whenever the user's shipments are written; None if there is no summary yet."""
+    doc = summaries_col.find_one({"_id": email}, {"total_shipments": 1, "updated_at": 1})
+    return (doc.get("total_shipments"), doc.get("updated_at")) if doc else None
+
+
+def reconcile() -> int:
+    """
+    Rebuild every summary from the shipments collection; returns the number written.
+
+    The replace only matches a summary last updated before this pass started.
+    A newer one was touched by `record_shipments` after the aggregation read
+    the shipments, so it is skipped (its upsert fails on the duplicate `_id`)
+    and left to the next pass.
+    """
+    now = datetime.now(timezone.utc)
+    horizon = now + timedelta(days=DUE_HORIZON_DAYS)
+    due = {"$convert": {"input": "$Expected_Delivery_Date", "to": "date", "onError": None, "onNull": None}}
+    pending = {"$gt": ["$_due", now]}
+    pipeline = [
+        {"$match": {"created_by_email": {"$exists": True}}},
+        {"$addFields": {"_due": due}},
+        # One group per (user, due day within the horizon / "later" / delivered)
+        {"$group": {
+            "_id": {"user": "$created_by_email", "day": {"$cond": [
+                pending,
+                {"$cond": [
+                    {"$lte": ["$_due", horizon]},
+                    {"$dateToString": {"format": "%Y-%m-%d", "date": "$_due"}},
+                    "later",
+                ]},
+                None,
+            ]}},
+            "count": {"$sum": 1},
+            "last_created_at": {"$max": "$created_at"},
+            "upcoming": {"$topN": {
+                "n": UPCOMING_LIMIT,
+                "sortBy": {"_due": 1},
+                "output": {"Shipment_Number": "$Shipment_Number", "Device": "$Device",
+                           "Expected_Delivery_Date": "$_due"},
+            }},
+        }},
+        {"$group": {
+            "_id": "$_id.user",
+            "total_shipments": {"$sum": "$count"},
+            "last_created_at": {"$max": "$last_created_at"},
+            "buckets": {"$push": {"day": "$_id.day", "count": "$count", "upcoming": "$upcoming"}},
+        }},
+    ]
+    ops = []
+    written = 0
+    skipped = 0
+    for group in shipments_col.aggregate(pipeline, allowDiskUse=True):
+        summary = {
+            "_id": group["_id"],
+            "total_shipments": group["total_shipments"],
+            "last_created_at": group.get("last_created_at"),
+            "due_days": {},
+            "due_later": 0,
+            "upcoming": [],
+            "updated_at": now,
+            "reconciled_at": now,
+        }
+        for bucket in group["buckets"]:
+            if bucket["day"] is None:
+                continue  # delivered
+            if bucket["day"] == "later":
+                summary["due_later"] = bucket["count"]
+            else:
+                summary["due_days"][bucket["day"]] = bucket["count"]
+            summary["upcoming"].extend(bucket["upcoming"])
+        summary["upcoming"] = sorted(
+            summary["upcoming"], key=lambda entry: entry["Expected_Delivery_Date"]
+        )[:UPCOMING_LIMIT]
+        ops.append(ReplaceOne({"_id": summary["_id"], "updated_at": {"$lte": now}}, summary, upsert=True))
+        if len(ops) >= 1000:
+            done = _replace_summaries(ops)
+            written += done
+            skipped += len(ops) - done
+            ops = []
+    if ops:
+        done = _replace_summaries(ops)
+        written += done
+        skipped += len(ops) - done
+    logger.info(f"Reconciled {written} shipment summaries ({skipped} updated during the pass, skipped)")
+    return written
+
+
+def _replace_summaries(ops: List[ReplaceOne]) -> int:
+    try:
+        summaries_col.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY for error in errors):
+            raise
+        return len(ops) - len(errors)
+    return len(ops)
+
+
+def acquire_lease(owner: str, ttl_seconds: float) -> bool:
+    """Take or renew the reconciler lease; False while another live worker holds it."""
+    now = datetime.now(timezone.utc)
+    try:
+        locks_col.update_one(
+            {"_id": LEASE_ID, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+class SummaryReconciler:
+    """
+    Runs `reconcile()` at startup and then every `interval_seconds` on a daemon
+    thread, in the one worker holding the lease. The lease outlives two
+    intervals, so another worker takes over if the holder dies.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="summary-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        # First pass at startup seeds summaries for users who had shipments before this existed
+        while not self._stop.is_set():
+            try:
+                if acquire_lease(self.owner, 2 * self.interval_seconds):
+                    reconcile()
+            except Exception as e:
+                logger.warning(f"Summary reconciliation failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+
+summary_reconciler = SummaryReconciler(SUMMARY_RECONCILE_SECONDS)
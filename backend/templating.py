@@ -0,0 +1,146 @@
+# backend/templating.py
+"""
+Shared Jinja2 environment, fragment cache and render timing.
+
+One environment serves every page. Compiled templates are persisted with
+`FileSystemBytecodeCache` under TEMPLATE_CACHE_DIR, so a fresh worker loads
+bytecode instead of re-parsing template sources.
+
+`FragmentCache` keeps rendered partials (e.g. the rows of a large table)
+keyed by (template, data version). While the version is unchanged the
+pre-rendered HTML is reused, and the data behind it need not even be
+fetched. Entries also expire after `ttl_seconds`, which bounds staleness
+when a version bump is missed.
+
+Every page and fragment render is timed per template; see `render_stats`.
+"""
+
+import threading
+from collections import OrderedDict
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from backend.config import (
+    BASE_DIR,
+    FRAGMENT_CACHE_MAX_ENTRIES,
+    FRAGMENT_CACHE_TTL_SECONDS,
+    TEMPLATE_AUTO_RELOAD,
+    TEMPLATE_CACHE_DIR,
+)
+
+TEMPLATES_DIR = BASE_DIR.parent / "templates"
+
+
+def _bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    try:
+        TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None  # read-only filesystem: compile in memory only
+    return FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR))
+
+
+environment = Environment(
+    loader=FileSystemLoader(str(TEMPLATES_DIR)),
+    autoescape=select_autoescape(["html", "xml"]),
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+)
+templates = Jinja2Templates(env=environment)
+
+
+# ---------------------
+# Render timing
+# ---------------------
+class RenderStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, list] = {}  # name -> [count, total_seconds, max_seconds]
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                name: {
+                    "renders": count,
+                    "avg_ms": round(total * 1000 / count, 3),
+                    "max_ms": round(worst * 1000, 3),
+                    "total_ms": round(total * 1000, 1),
+                }
+                for name, (count, total, worst) in sorted(self._stats.items())
+            }
+
+
+render_stats = RenderStats()
+
+
+def render_template(template: str, ctx: dict, status_code: int = 200) -> HTMLResponse:
+    started = perf_counter()
+    response = templates.TemplateResponse(template, ctx, status_code=status_code)
+    render_stats.record(template, perf_counter() - started)
+    return response
+
+
+# ---------------------
+# Fragment cache
+# ---------------------
+class FragmentCache:
+    def __init__(self, env: Environment, max_entries: int = 512, ttl_seconds: float = 60.0):
+        self.env = env
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Markup]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, template: str, version: Optional[Hashable],
+               context: Union[Dict[str, Any], Callable[[], Dict[str, Any]]]) -> Markup:
+        """
+        Rendered `template` for data `version`. `context` may be a callable, so
+        the data is only loaded on a miss. A None version is never cached.
+        """
+        key = (template, version)
+        if version is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+
+        started = perf_counter()
+        html = Markup(self.env.get_template(template).render(context() if callable(context) else context))
+        render_stats.record(template, perf_counter() - started)
+
+        if version is not None:
+            with self._lock:
+                self._entries[key] = (monotonic() + self.ttl_seconds, html)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return html
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+fragment_cache = FragmentCache(environment, FRAGMENT_CACHE_MAX_ENTRIES, FRAGMENT_CACHE_TTL_SECONDS)
@@ -0,0 +1,69 @@
+# benchmarks/serialization.py
+"""
+JSON serialisation cost for stream-sized payloads.
+
+Compares the old path (per-row `_id`/`timestamp` conversion in Python, then
+FastAPI's `jsonable_encoder` and the stdlib-based `JSONResponse`) with
+`FastJSONResponse`, which hands the raw Mongo documents to orjson.
+
+    python benchmarks/serialization.py --rows 10000
+"""
+
+import argparse
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from backend.responses import FastJSONResponse  # noqa: E402
+
+
+def make_rows(n: int):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "_id": ObjectId(),
+            "Device_ID": f"D{1150 + i % 9}",
+            "Battery_Level": round(random.uniform(2.0, 5.0), 2),
+            "First_Sensor_temperature": round(random.uniform(10.0, 40.0), 1),
+            "Route_From": "Chennai, India",
+            "Route_To": "London, UK",
+            "timestamp": start + timedelta(seconds=10 * i),
+        }
+        for i in range(n)
+    ]
+
+
+def old_path(rows):
+    docs = [dict(r) for r in rows]
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+        if isinstance(doc.get("timestamp"), datetime):
+            doc["timestamp"] = doc["timestamp"].isoformat()
+    return JSONResponse(jsonable_encoder({"device": "D1150", "stream_data": docs})).body
+
+
+def new_path(rows):
+    return FastJSONResponse({"device": "D1150", "stream_data": rows}).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    for name, fn in (("jsonable_encoder + JSONResponse", old_path), ("FastJSONResponse (orjson)", new_path)):
+        best = min(timeit.repeat(lambda: fn(rows), number=1, repeat=args.repeat))
+        print(f"{name:<34} {best * 1000:8.2f} ms  ({len(fn(rows)) / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
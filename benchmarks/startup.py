@@ -0,0 +1,50 @@
+# benchmarks/startup.py
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the app.
+
+    python benchmarks/startup.py            # 10 runs of `import main`
+    python benchmarks/startup.py -n 20 --module backend.routes
+
+Each run is a new process, so this is what an autoscaled worker pays before it
+can accept traffic. No database is needed: importing must not connect.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SNIPPET = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def run_once(module: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    parser.add_argument("--module", default="main")
+    args = parser.parse_args()
+
+    run_once(args.module)  # populate __pycache__ so every measured run is comparable
+    timings = [run_once(args.module) for _ in range(args.runs)]
+    print(f"import {args.module}: median {statistics.median(timings):.1f} ms, "
+          f"min {min(timings):.1f} ms, max {max(timings):.1f} ms over {args.runs} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# alerts.py
+"""
+Streaming threshold alerts for device readings.
+
+Every device keeps a fixed-size NumPy ring buffer of its recent
+(timestamp, temperature, battery) samples. Each consumed batch is grouped
+by device with vectorised sorting, and every rule is evaluated at every
+reading of the batch in one vectorised pass over all devices: each reading's
+window is gathered from its device's buffered history and the readings
+before it. A breach that recovers within one batch therefore still opens
+and resolves an alert, with no Python loop per reading or per device. Alerts are deduplicated by keeping one `active` alert per
+(device, rule): a new one opens only when a rule starts breaching and it is
+resolved when the rule clears. `seed_active` loads the open alerts on
+startup, so a restart neither resolves nor reopens them.
+"""
+
+import json
+import operator
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pymongo import UpdateOne
+
+FIELDS = {
+    "temperature": "First_Sensor_temperature",
+    "battery": "Battery_Level",
+}
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+@dataclass
+class Rule:
+    """
+    kind="window_avg":  mean of `field` over the last `window_seconds` <op> threshold
+    kind="consecutive": last `count` readings of `field` all <op> threshold
+    """
+    name: str
+    field: str
+    kind: str
+    op: str
+    threshold: float
+    window_seconds: float = 300.0
+    count: int = 3
+    severity: str = "warning"
+
+    def __post_init__(self):
+        if self.field not in FIELDS:
+            raise ValueError(f"Unknown alert field '{self.field}'")
+        if self.kind not in {"window_avg", "consecutive"}:
+            raise ValueError(f"Unknown alert kind '{self.kind}'")
+        if self.op not in OPS:
+            raise ValueError(f"Unknown alert operator '{self.op}'")
+
+
+DEFAULT_RULES = [
+    Rule("high_avg_temperature", "temperature", "window_avg", ">", 30.0, window_seconds=300, severity="critical"),
+    Rule("low_battery", "battery", "consecutive", "<", 2.5, count=3),
+]
+
+
+def load_rules(raw: Optional[str]) -> List[Rule]:
+    """Rules come from the ALERT_RULES env var (JSON list of Rule kwargs) or the defaults."""
+    if not raw:
+        return list(DEFAULT_RULES)
+    return [Rule(**spec) for spec in json.loads(raw)]
+
+
+def _to_epoch(value) -> float:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return _to_epoch(datetime.fromisoformat(value))
+        except ValueError:
+            pass
+    return datetime.now(timezone.utc).timestamp()
+
+
+class AlertEngine:
+    """
+    Ring buffers live in 2-D arrays with one row ("slot") per device, so a
+    batch gathers every device's history, evaluates each rule over all batch
+    readings and writes the batch back with a handful of NumPy operations.
+    """
+
+    def __init__(self, rules: List[Rule], buffer_size: int = 256):
+        self.rules = rules
+        self.buffer_size = buffer_size
+        self._rule_index = {rule.name: i for i, rule in enumerate(rules)}
+        self._slots: Dict[str, int] = {}
+        self._ts = np.empty((0, buffer_size), dtype=np.float64)
+        self._values = {name: np.empty((0, buffer_size), dtype=np.float32) for name in FIELDS}
+        self._head = np.empty(0, dtype=np.int64)
+        self._size = np.empty(0, dtype=np.int64)
+        # slot x rule -> alert currently active
+        self._active = np.empty((0, len(rules)), dtype=bool)
+
+    def _slot(self, device: str) -> int:
+        slot = self._slots.get(device)
+        if slot is None:
+            slot = self._slots[device] = len(self._slots)
+            if slot >= self._head.shape[0]:
+                self._grow(max(64, 2 * self._head.shape[0]))
+        return slot
+
+    def _grow(self, rows: int) -> None:
+        extra = rows - self._head.shape[0]
+        self._ts = np.vstack((self._ts, np.full((extra, self.buffer_size), np.nan)))
+        self._values = {
+            name: np.vstack((arr, np.full((extra, self.buffer_size), np.nan, dtype=np.float32)))
+            for name, arr in self._values.items()
+        }
+        self._head = np.concatenate((self._head, np.zeros(extra, dtype=np.int64)))
+        self._size = np.concatenate((self._size, np.zeros(extra, dtype=np.int64)))
+        self._active = np.vstack((self._active, np.zeros((extra, len(self.rules)), dtype=bool)))
+
+    def seed_active(self, active_alerts: Iterable[Dict]) -> None:
+        """Mark the (device, rule) pairs of stored `active` alerts as breaching."""
+        for alert in active_alerts:
+            rule_index = self._rule_index.get(alert["rule"])
+            if rule_index is not None:
+                self._active[self._slot(alert["device"]), rule_index] = True
+
+    def process(self, docs: List[Dict]) -> List[UpdateOne]:
+        """Feed a batch of readings; returns the alert write operations it produced."""
+        devices = np.array([str(d.get("Device_ID", "")) for d in docs], dtype=object)
+        keep = devices != ""
+        if not keep.any():
+            return []
+        docs = [doc for doc, kept in zip(docs, keep) if kept]
+        devices = devices[keep]
+        ts = np.fromiter((_to_epoch(d.get("timestamp")) for d in docs), dtype=np.float64, count=len(docs))
+        values = {
+            # float32, as the ring stores them, so history and batch compare alike
+            name: np.fromiter((_as_float(d.get(key)) for d in docs), dtype=np.float32, count=len(docs)).astype(np.float64)
+            for name, key in FIELDS.items()
+        }
+
+        # Group rows by device, time-ordered within each device
+        names, codes = np.unique(devices, return_inverse=True)
+        order = np.lexsort((ts, codes))
+        codes, ts = codes[order], ts[order]
+        values = {name: arr[order] for name, arr in values.items()}
+        slots = np.fromiter((self._slot(name) for name in names), dtype=np.int64, count=len(names))
+        row_slot = slots[codes]
+        per_device = np.bincount(codes, minlength=len(names))
+        batch_start = np.cumsum(per_device) - per_device
+        j = np.arange(len(codes)) - batch_start[codes]   # index of a row within its device's batch
+
+        # Lay out [history (cap slots, oldest first, NaN where the ring is not full), batch]
+        # per device back to back, so the samples the ring holds after any row are the
+        # `cap` positions ending at that row: one strided view, no per-device loop
+        cap = self.buffer_size
+        ring_order = (self._head[slots, None] + np.arange(cap)) % cap
+        seg_start = np.arange(len(names)) * cap + batch_start
+        history_pos = seg_start[:, None] + np.arange(cap)
+        row_pos = seg_start[codes] + cap + j
+        flat_ts = np.empty(len(names) * cap + len(codes))
+        flat_ts[history_pos] = np.take_along_axis(self._ts[slots], ring_order, axis=1)
+        flat_ts[row_pos] = ts
+        flat_values = {}
+        for name in FIELDS:
+            flat = np.empty_like(flat_ts)
+            flat[history_pos] = np.take_along_axis(self._values[name][slots], ring_order, axis=1)
+            flat[row_pos] = values[name]
+            flat_values[name] = flat
+        held = np.minimum(self._size[row_slot] + j + 1, cap)
+
+        def window(flat: np.ndarray, width: int) -> np.ndarray:
+            """The `width` newest samples the ring holds after each row, one row each."""
+            return sliding_window_view(flat, width)[row_pos + 1 - width]
+
+        # Integer (microsecond) sort keys, segment-major: when every device's samples are in
+        # time order, the flat layout is sorted by key and a time window is one searchsorted
+        # plus prefix sums. That beats gathering `cap` samples per row unless most of the
+        # layout is history (many devices with a reading or two each).
+        sorted_layout = flat_ts.shape[0] * 4 < len(codes) * cap
+        if sorted_layout:
+            t0 = int(round(np.nanmin(flat_ts) * 1e6))
+            rel = np.where(np.isnan(flat_ts), 0, np.rint(np.nan_to_num(flat_ts) * 1e6) - t0 + 1).astype(np.int64)
+            span = int(rel.max()) + 2
+            keys = np.repeat(np.arange(len(names)), cap + per_device) * span + rel
+            sorted_layout = span * len(names) < 2 ** 62 and bool(np.all(np.diff(keys) >= 0))
+
+        transitions: List[Tuple[int, int, UpdateOne]] = []
+        for rule_index, rule in enumerate(self.rules):
+            field_values = flat_values[rule.field]
+            if rule.kind == "window_avg" and sorted_layout:
+                # Prefix sums: window = [first sample at or after ts - window, row], capped by the ring
+                since = np.maximum(np.rint((ts - rule.window_seconds) * 1e6) - t0 + 1, 1).astype(np.int64)
+                lo = np.maximum(np.searchsorted(keys, codes * span + since), row_pos + 1 - cap)
+                valid = ~np.isnan(field_values)
+                sums = np.r_[0.0, np.cumsum(np.where(valid, field_values, 0.0))]
+                seen = np.r_[0, np.cumsum(valid)]
+                counts = seen[row_pos + 1] - seen[lo]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    rule_values = (sums[row_pos + 1] - sums[lo]) / counts
+                breached = OPS[rule.op](rule_values, rule.threshold)
+                decided = counts > 0
+            elif rule.kind == "window_avg":
+                # Out-of-order readings: test every sample the ring holds after each row
+                samples = window(field_values, cap)
+                in_window = (window(flat_ts, cap) >= ts[:, None] - rule.window_seconds) & ~np.isnan(samples)
+                counts = in_window.sum(axis=1)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    rule_values = np.where(in_window, samples, 0.0).sum(axis=1) / counts
+                breached = OPS[rule.op](rule_values, rule.threshold)
+                decided = counts > 0
+            else:
+                # NaN compares False, so a missing value breaks a run
+                breached = OPS[rule.op](window(field_values, min(rule.count, cap)), rule.threshold).all(axis=1)
+                rule_values = values[rule.field]
+                decided = held >= rule.count
+
+            # Undecided readings keep the previous state; a transition is any change of it
+            rows = np.flatnonzero(decided)
+            if rows.size == 0:
+                continue
+            current = breached[rows]
+            first_of_device = np.r_[True, codes[rows][1:] != codes[rows][:-1]]
+            previous = np.where(first_of_device, self._active[row_slot[rows], rule_index], np.r_[False, current[:-1]])
+            last_of_device = np.r_[first_of_device[1:], True]
+            self._active[row_slot[rows[last_of_device]], rule_index] = current[last_of_device]
+            for i in rows[current != previous]:
+                device = names[codes[i]]
+                at = datetime.fromtimestamp(ts[i], tz=timezone.utc)
+                op = (self._open(device, rule, float(rule_values[i]), at) if breached[i]
+                      else self._resolve(device, rule, at))
+                transitions.append((int(i), rule_index, op))
+
+        # Only the newest `cap` readings of a device survive in its ring
+        write = j >= per_device[codes] - cap
+        pos = (self._head[row_slot] + j) % cap
+        self._ts[row_slot[write], pos[write]] = ts[write]
+        for name in FIELDS:
+            self._values[name][row_slot[write], pos[write]] = values[name][write]
+        self._head[slots] = (self._head[slots] + per_device) % cap
+        self._size[slots] = np.minimum(self._size[slots] + per_device, cap)
+
+        # Each device's alert writes stay in reading order
+        transitions.sort(key=lambda item: (item[0], item[1]))
+        return [op for _, _, op in transitions]
+
+    @staticmethod
+    def _open(device: str, rule: Rule, value: float, now: datetime) -> UpdateOne:
+        # Upsert on the active (device, rule) pair keeps alerts deduplicated across restarts
+        return UpdateOne(
+            {"device": device, "rule": rule.name, "status": "active"},
+            {
+                "$setOnInsert": {
+                    "severity": rule.severity,
+                    "field": FIELDS[rule.field],
+                    "threshold": rule.threshold,
+                    "opened_at": now,
+                },
+                "$set": {"value": value, "updated_at": now},
+            },
+            upsert=True,
+        )
+
+    @staticmethod
+    def _resolve(device: str, rule: Rule, now: datetime) -> UpdateOne:
+        return UpdateOne(
+            {"device": device, "rule": rule.name, "status": "active"},
+            {"$set": {"status": "resolved", "resolved_at": now, "updated_at": now}},
+        )
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
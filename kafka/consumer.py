@@ -4,10 +4,17 @@ load_dotenv()
 
 from kafka import KafkaConsumer
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError, ServerSelectionTimeoutError
+from collections import deque
+from datetime import datetime
+import asyncio
 import json
 import time
 import sys
 
+from alerts import AlertEngine, load_rules
+from route_stats import route_device_indexes, route_device_ops, route_stat_ops
+
 def get_env_var(name):
     value = os.getenv(name)
     if not value:
@@ -20,6 +27,20 @@ KAFKA_BROKER = get_env_var("KAFKA_BROKER")
 MONGO_URI = get_env_var("MONGO_URI")
 DB_NAME = get_env_var("DB_NAME")
 COLLECTION_NAME = get_env_var("DEVICE_DATA_COLLECTION")
+ALERTS_COLLECTION_NAME = os.getenv("ALERTS_COLLECTION", "alerts")
+ROUTE_STATS_COLLECTION_NAME = os.getenv("ROUTE_STATS_COLLECTION", "route_stats")
+ROUTE_DEVICES_COLLECTION_NAME = os.getenv("ROUTE_DEVICES_COLLECTION", "route_devices")
+ROUTE_DEVICE_RETENTION_DAYS = int(os.getenv("ROUTE_DEVICE_RETENTION_DAYS", "30"))  # TTL of per-lane device last-seen
+
+BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", "500"))
+POLL_TIMEOUT_MS = int(os.getenv("CONSUMER_POLL_TIMEOUT_MS", "1000"))
+ALERT_BUFFER_SIZE = int(os.getenv("ALERT_BUFFER_SIZE", "256"))
+
+# "sync": poll -> decode -> write loop (default) / "async": pipelined aiokafka + async Mongo writes
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "sync")
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))  # batches buffered between stages
+PIPELINE_WRITE_CONCURRENCY = int(os.getenv("PIPELINE_WRITE_CONCURRENCY", "4"))
+PIPELINE_WRITE_RETRIES = int(os.getenv("PIPELINE_WRITE_RETRIES", "3"))  # attempts before the pipeline stops
 
 def connect_kafka():
     for attempt in range(10):
@@ -44,30 +65,329 @@ def connect_mongodb():
         client = MongoClient(MONGO_URI)
         db = client[DB_NAME]  
         collection = db[COLLECTION_NAME]
+        alerts = db[ALERTS_COLLECTION_NAME]
+        alerts.create_index([("device", 1), ("rule", 1), ("status", 1)])
+        alerts.create_index([("status", 1), ("opened_at", -1)])
+        route_stats = db[ROUTE_STATS_COLLECTION_NAME]
+        # Lane documents no longer carry a per-device map; drop the one older versions grew
+        route_stats.update_many({"devices": {"$exists": True}}, {"$unset": {"devices": ""}})
+        route_devices = db[ROUTE_DEVICES_COLLECTION_NAME]
+        route_devices.create_indexes(route_device_indexes(ROUTE_DEVICE_RETENTION_DAYS * 86400))
         print("[✓] Connected to MongoDB")
-        return collection
+        return collection, alerts, route_stats, route_devices
     except Exception as e:
         print(f"[✗] MongoDB connection error: {e}")
         sys.exit(1)
 
-def main():
+def decode_reading(data):
+    # The producer serialises datetimes with str(); store real dates so range queries work
+    ts = data.get("timestamp")
+    if isinstance(ts, str):
+        try:
+            data["timestamp"] = datetime.fromisoformat(ts)
+        except ValueError:
+            pass
+    return data
+
+def run_sync():
     consumer = connect_kafka()
-    collection = connect_mongodb()
+    collection, alerts, route_stats, route_devices = connect_mongodb()
     collection.delete_many({})
+    engine = AlertEngine(load_rules(os.getenv("ALERT_RULES")), buffer_size=ALERT_BUFFER_SIZE)
+    engine.seed_active(alerts.find({"status": "active"}, {"device": 1, "rule": 1}))
     print("[*] Kafka consumer started. Waiting for messages...")
     
     try:
-        for message in consumer:
+        while True:
+            records = consumer.poll(timeout_ms=POLL_TIMEOUT_MS, max_records=BATCH_SIZE)
+            docs = [decode_reading(msg.value) for batch in records.values() for msg in batch]
+            if not docs:
+                continue
+            try:
+                collection.insert_many(docs, ordered=False)
+                print(f"[→] Inserted {len(docs)} documents")
+            except BulkWriteError as e:
+                print(f"[!] Partial batch insert: {e.details.get('nInserted', 0)}/{len(docs)} documents")
+            except Exception as e:
+                print(f"[!] Error processing batch: {e}")
+            try:
+                stat_ops = route_stat_ops(docs)
+                if stat_ops:
+                    route_stats.bulk_write(stat_ops, ordered=False)
+                device_ops = route_device_ops(docs)
+                if device_ops:
+                    route_devices.bulk_write(device_ops, ordered=False)
+            except Exception as e:
+                print(f"[!] Error updating route stats: {e}")
             try:
-                data = message.value
-                collection.insert_one(data)
-                print(f"[→] Inserted document with ID: {data.get('_id', 'N/A')}")
+                alert_ops = engine.process(docs)
+                if alert_ops:
+                    alerts.bulk_write(alert_ops, ordered=True)
+                    print(f"[⚠] {len(alert_ops)} alert state changes")
             except Exception as e:
-                print(f"[!] Error processing message: {e}")
+                print(f"[!] Error evaluating alerts: {e}")
     except KeyboardInterrupt:
         print("[*] Shutting down consumer...")
     finally:
         consumer.close()
 
+# ---------------------
+# Pipelined async mode
+# ---------------------
+# fetch -> decode/alerts -> N concurrent writers (+ one ordered alert writer) -> in-order commits.
+# Every stage is joined by a bounded queue, so a slow Mongo backs up to the fetcher instead of
+# buffering without limit, while Kafka fetches and Mongo writes overlap.
+# A batch that cannot be written stops the pipeline: its offsets are never committed, so after
+# a restart the consumer group re-reads it from the last commit.
+DUPLICATE_KEY = 11000
+
+# Errors raised before the request reached a server, so the write certainly was not applied
+NOT_APPLIED = (ServerSelectionTimeoutError,)
+
+
+class PipelineWriteError(Exception):
+    pass
+
+class PipelineBatch:
+    __slots__ = ("seq", "offsets", "raw", "docs", "alert_ops", "pending")
+
+    def __init__(self, seq, offsets, raw):
+        self.seq = seq
+        self.offsets = offsets    # TopicPartition -> next offset to consume
+        self.raw = raw
+        self.docs = []
+        self.alert_ops = []
+        self.pending = 2          # reading/route-stat writes + alert writes
+
+
+class CommitTracker:
+    """Batches in fetch order; only a fully written prefix is ever committed."""
+
+    def __init__(self):
+        self.batches = deque()
+        self.ready = asyncio.Event()
+
+    def register(self, batch):
+        self.batches.append(batch)
+
+    def done(self, batch):
+        batch.pending -= 1
+        if batch.pending == 0:
+            self.ready.set()
+
+    def committable(self):
+        offsets = {}
+        while self.batches and self.batches[0].pending == 0:
+            offsets.update(self.batches.popleft().offsets)
+        return offsets
+
+
+def prepare_batch(raw, engine):
+    docs = []
+    for value in raw:
+        try:
+            data = json.loads(value)
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get("Device_ID"):
+            docs.append(decode_reading(data))
+    try:
+        alert_ops = engine.process(docs)
+    except Exception as e:
+        print(f"[!] Error evaluating alerts: {e}")
+        alert_ops = []
+    return docs, alert_ops
+
+
+async def with_retries(operation, what, retryable):
+    """Run `operation`, retrying only `retryable` errors; raises PipelineWriteError when attempts run out."""
+    for attempt in range(PIPELINE_WRITE_RETRIES):
+        try:
+            return await operation()
+        except BulkWriteError:
+            raise
+        except retryable as e:
+            print(f"[!] {what} failed (attempt {attempt + 1}/{PIPELINE_WRITE_RETRIES}): {e}")
+            if attempt + 1 < PIPELINE_WRITE_RETRIES:
+                await asyncio.sleep(2 ** attempt)
+    raise PipelineWriteError(f"Giving up on {what} after {PIPELINE_WRITE_RETRIES} attempts")
+
+
+async def insert_readings(collection, docs):
+    # insert_many stamps each doc with its _id on the first attempt, so a retry after an
+    # ambiguous network error cannot duplicate readings: already stored ones fail as duplicates
+    try:
+        await with_retries(lambda: collection.insert_many(docs, ordered=False), "reading insert", ConnectionFailure)
+        print(f"[→] Inserted {len(docs)} documents")
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY for error in errors):
+            print(f"[!] Partial batch insert: {e.details.get('nInserted', 0)}/{len(docs)} documents")
+        else:
+            print(f"[→] Inserted {len(docs)} documents ({len(errors)} already stored)")
+
+
+async def update_route_stats(route_stats, route_devices, docs):
+    # $inc is not idempotent: retry only when the update certainly never reached the server
+    stat_ops = route_stat_ops(docs)
+    if stat_ops:
+        try:
+            await with_retries(lambda: route_stats.bulk_write(stat_ops, ordered=False), "route stats update", NOT_APPLIED)
+        except (BulkWriteError, ConnectionFailure) as e:
+            # May have been (partly) applied; skipping can under-count one batch, retrying could double it
+            print(f"[!] Route stats update outcome unknown, not retried: {e}")
+    # $max upserts are idempotent, so these retry on any connection error
+    device_ops = route_device_ops(docs)
+    if device_ops:
+        await with_retries(lambda: route_devices.bulk_write(device_ops, ordered=False), "route device update", ConnectionFailure)
+
+
+async def fetch_stage(consumer, decode_queue, tracker):
+    seq = 0
+    while True:
+        records = await consumer.getmany(timeout_ms=POLL_TIMEOUT_MS, max_records=BATCH_SIZE)
+        if not records:
+            continue
+        offsets = {tp: msgs[-1].offset + 1 for tp, msgs in records.items() if msgs}
+        batch = PipelineBatch(seq, offsets, [msg.value for msgs in records.values() for msg in msgs])
+        seq += 1
+        tracker.register(batch)
+        await decode_queue.put(batch)
+
+
+async def decode_stage(decode_queue, write_queue, alert_queue, engine):
+    # A single task, so the alert engine still sees readings in offset order
+    while True:
+        batch = await decode_queue.get()
+        batch.docs, batch.alert_ops = await asyncio.to_thread(prepare_batch, batch.raw, engine)
+        batch.raw = None
+        await write_queue.put(batch)
+        await alert_queue.put(batch)
+
+
+async def write_stage(write_queue, collection, route_stats, route_devices, tracker):
+    # Any other error propagates and stops the pipeline with this batch left uncommitted
+    while True:
+        batch = await write_queue.get()
+        if batch.docs:
+            await insert_readings(collection, batch.docs)
+            # $inc/$max/$min upserts commute, so concurrent writers may apply them in any order
+            await update_route_stats(route_stats, route_devices, batch.docs)
+        tracker.done(batch)
+
+
+async def alert_stage(alert_queue, alerts, tracker):
+    # Open/resolve transitions must land in order, so alert writes stay sequential.
+    # A failed write stops the pipeline; on restart the engine re-seeds from the stored
+    # alerts and re-derives the transitions from the replayed readings.
+    while True:
+        batch = await alert_queue.get()
+        if batch.alert_ops:
+            await with_retries(lambda: alerts.bulk_write(batch.alert_ops, ordered=True), "alert update", NOT_APPLIED)
+            print(f"[⚠] {len(batch.alert_ops)} alert state changes")
+        tracker.done(batch)
+
+
+async def commit_offsets(consumer, tracker):
+    offsets = tracker.committable()
+    if offsets:
+        try:
+            await consumer.commit(offsets)
+        except Exception as e:
+            # e.g. partitions revoked by a rebalance; the new owner re-reads from the last commit
+            print(f"[!] Offset commit failed: {e}")
+
+
+async def commit_stage(consumer, tracker):
+    while True:
+        await tracker.ready.wait()
+        tracker.ready.clear()
+        await commit_offsets(consumer, tracker)
+
+
+async def connect_kafka_async():
+    from aiokafka import AIOKafkaConsumer
+
+    for attempt in range(10):
+        consumer = AIOKafkaConsumer(
+            KAFKA_TOPIC,
+            bootstrap_servers=KAFKA_BROKER,
+            auto_offset_reset='earliest',
+            group_id='route-group',
+            enable_auto_commit=False,
+            max_poll_records=BATCH_SIZE,
+        )
+        try:
+            await consumer.start()
+            print("[✓] Connected to Kafka")
+            return consumer
+        except Exception as e:
+            await consumer.stop()
+            print(f"[!] Kafka connection failed (attempt {attempt + 1}/10): {e}")
+            await asyncio.sleep(5)
+    print("[✗] Failed to connect to Kafka after 10 attempts")
+    sys.exit(1)
+
+
+async def run_async():
+    from pymongo import AsyncMongoClient
+
+    consumer = await connect_kafka_async()
+    client = AsyncMongoClient(MONGO_URI)
+    db = client[DB_NAME]
+    collection = db[COLLECTION_NAME]
+    alerts = db[ALERTS_COLLECTION_NAME]
+    route_stats = db[ROUTE_STATS_COLLECTION_NAME]
+    route_devices = db[ROUTE_DEVICES_COLLECTION_NAME]
+    try:
+        await alerts.create_index([("device", 1), ("rule", 1), ("status", 1)])
+        await alerts.create_index([("status", 1), ("opened_at", -1)])
+        await route_stats.update_many({"devices": {"$exists": True}}, {"$unset": {"devices": ""}})
+        await route_devices.create_indexes(route_device_indexes(ROUTE_DEVICE_RETENTION_DAYS * 86400))
+        await collection.delete_many({})
+        print("[✓] Connected to MongoDB")
+    except Exception as e:
+        print(f"[✗] MongoDB connection error: {e}")
+        await consumer.stop()
+        sys.exit(1)
+
+    engine = AlertEngine(load_rules(os.getenv("ALERT_RULES")), buffer_size=ALERT_BUFFER_SIZE)
+    engine.seed_active(await alerts.find({"status": "active"}, {"device": 1, "rule": 1}).to_list(None))
+    tracker = CommitTracker()
+    decode_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    write_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    alert_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    tasks = [
+        asyncio.create_task(fetch_stage(consumer, decode_queue, tracker)),
+        asyncio.create_task(decode_stage(decode_queue, write_queue, alert_queue, engine)),
+        asyncio.create_task(alert_stage(alert_queue, alerts, tracker)),
+        asyncio.create_task(commit_stage(consumer, tracker)),
+    ]
+    tasks += [asyncio.create_task(write_stage(write_queue, collection, route_stats, route_devices, tracker))
+              for _ in range(PIPELINE_WRITE_CONCURRENCY)]
+    print(f"[*] Pipelined Kafka consumer started ({PIPELINE_WRITE_CONCURRENCY} writers). Waiting for messages...")
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await commit_offsets(consumer, tracker)  # whatever finished before shutdown
+        await consumer.stop()
+        await client.close()
+
+
+def main():
+    if CONSUMER_MODE == "async":
+        try:
+            asyncio.run(run_async())
+        except KeyboardInterrupt:
+            print("[*] Shutting down consumer...")
+        except (PipelineWriteError, PyMongoError) as e:
+            print(f"[✗] Pipeline stopped, uncommitted batches will be re-read on restart: {e}")
+            sys.exit(1)
+    else:
+        run_sync()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
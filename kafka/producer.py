@@ -3,6 +3,8 @@ import os
 import json
 import time
 import random
+import asyncio
+import resource
 from datetime import datetime, timezone
 from kafka import KafkaProducer
 
@@ -10,51 +12,251 @@ from kafka import KafkaProducer
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka:9092")
 KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "sensor_data")
 
-# Retry connection
-producer = None
-for i in range(10):
-    try:
-        producer = KafkaProducer(
-            bootstrap_servers=KAFKA_BROKER,
-            value_serializer=lambda v: json.dumps(v, default=str).encode('utf-8'),
-            request_timeout_ms=20000,
-            max_block_ms=30000
-        )
-        print(f"[✓] Producer connected to Kafka at {KAFKA_BROKER}")
-        break
-    except Exception as e:
-        print(f"[!] Kafka connection failed (attempt {i+1}/10): {e}")
-        time.sleep(5)
-else:
+# "random": generate test readings (default) / "socket": bridge device TCP connections to Kafka
+PRODUCER_MODE = os.getenv("PRODUCER_MODE", "random")
+
+SOCKET_HOST = os.getenv("SOCKET_HOST", "0.0.0.0")
+SOCKET_PORT = int(os.getenv("SOCKET_PORT", "5050"))
+BRIDGE_QUEUE_SIZE = int(os.getenv("BRIDGE_QUEUE_SIZE", "20000"))
+BRIDGE_BATCH_SIZE = int(os.getenv("BRIDGE_BATCH_SIZE", "1000"))
+BRIDGE_MAX_INFLIGHT_BATCHES = int(os.getenv("BRIDGE_MAX_INFLIGHT_BATCHES", "4"))
+BRIDGE_MAX_LINE_BYTES = int(os.getenv("BRIDGE_MAX_LINE_BYTES", "65536"))
+BRIDGE_IDLE_TIMEOUT = float(os.getenv("BRIDGE_IDLE_TIMEOUT", "300"))
+
+
+def serialize(value):
+    return json.dumps(value, default=str).encode('utf-8')
+
+
+def connect_producer():
+    # Retry connection
+    for i in range(10):
+        try:
+            producer = KafkaProducer(
+                bootstrap_servers=KAFKA_BROKER,
+                value_serializer=serialize,
+                request_timeout_ms=20000,
+                max_block_ms=30000
+            )
+            print(f"[✓] Producer connected to Kafka at {KAFKA_BROKER}")
+            return producer
+        except Exception as e:
+            print(f"[!] Kafka connection failed (attempt {i+1}/10): {e}")
+            time.sleep(5)
     raise RuntimeError("Failed to connect to Kafka after 10 attempts")
 
-# Data generation
-routes = ['New York, USA', 'Chennai, India', 'Bengaluru, India', 'London, UK']
 
-print(f"[→] Starting to send sensor data to topic: '{KAFKA_TOPIC}'")
-try:
+def run_random():
+    producer = connect_producer()
+
+    # Data generation
+    routes = ['New York, USA', 'Chennai, India', 'Bengaluru, India', 'London, UK']
+
+    print(f"[→] Starting to send sensor data to topic: '{KAFKA_TOPIC}'")
+    try:
+        while True:
+            route_from = random.choice(routes)
+            route_to = random.choice(routes)
+            if route_from == route_to:
+                continue
+
+            data = {
+                "Device_ID": f"D{random.randint(1150, 1158)}",  # e.g., "D1151"
+                "Battery_Level": round(random.uniform(2.0, 5.0), 2),
+                "First_Sensor_temperature": round(random.uniform(10.0, 40.0), 1),
+                "Route_From": route_from,
+                "Route_To": route_to,
+                "timestamp": datetime.now(timezone.utc)
+            }
+
+            producer.send(KAFKA_TOPIC, value=data)
+            print(f"✅ Sent: {data['Device_ID']} | {data['Battery_Level']}V | {data['First_Sensor_temperature']}°C")
+            time.sleep(10)  # Send every 10 sec
+
+    except KeyboardInterrupt:
+        print("\n[!] Stopping producer...")
+    finally:
+        if producer:
+            producer.flush()
+            producer.close()
+
+
+# =====================================================================================
+# SOCKET BRIDGE: device TCP connections -> Kafka
+# =====================================================================================
+# Devices send newline-delimited JSON readings. Every connection handler
+# pushes parsed readings into one bounded queue; when Kafka falls behind the
+# queue fills, `queue.put` blocks, the handlers stop reading and TCP flow
+# control pushes back on the devices instead of buffering without limit.
+class BridgeStats:
+    def __init__(self):
+        self.connections = 0
+        self.received = 0
+        self.sent = 0
+        self.invalid = 0
+        self.failed = 0
+
+
+def parse_reading(line: bytes):
+    data = json.loads(line)
+    if not isinstance(data, dict) or not data.get("Device_ID"):
+        raise ValueError("reading must be a JSON object with Device_ID")
+    data.setdefault("timestamp", datetime.now(timezone.utc).isoformat(sep=" "))
+    return data
+
+
+async def handle_device(reader, writer, queue, stats):
+    stats.connections += 1
+    try:
+        while True:
+            try:
+                line = await asyncio.wait_for(reader.readline(), timeout=BRIDGE_IDLE_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError):
+                break  # idle device or a frame over BRIDGE_MAX_LINE_BYTES
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                reading = parse_reading(line)
+            except ValueError:
+                stats.invalid += 1
+                continue
+            stats.received += 1
+            await queue.put(reading)  # blocks (and stops reading this socket) while the queue is full
+    except ConnectionError:
+        pass
+    finally:
+        stats.connections -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def kafka_sender(queue, producer, stats):
+    inflight = asyncio.Semaphore(BRIDGE_MAX_INFLIGHT_BATCHES)
+    deliveries = set()
+
+    async def deliver(futures):
+        try:
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            failed = sum(isinstance(r, Exception) for r in results)
+            stats.sent += len(results) - failed
+            stats.failed += failed
+        finally:
+            inflight.release()
+
     while True:
-        route_from = random.choice(routes)
-        route_to = random.choice(routes)
-        if route_from == route_to:
-            continue
-
-        data = {
-            "Device_ID": f"D{random.randint(1150, 1158)}",  # e.g., "D1151"
-            "Battery_Level": round(random.uniform(2.0, 5.0), 2),
-            "First_Sensor_temperature": round(random.uniform(10.0, 40.0), 1),
-            "Route_From": route_from,
-            "Route_To": route_to,
-            "timestamp": datetime.now(timezone.utc)
-        }
-
-        producer.send(KAFKA_TOPIC, value=data)
-        print(f"✅ Sent: {data['Device_ID']} | {data['Battery_Level']}V | {data['First_Sensor_temperature']}°C")
-        time.sleep(10)  # Send every 10 sec
-
-except KeyboardInterrupt:
-    print("\n[!] Stopping producer...")
-finally:
-    if producer:
-        producer.flush()
-        producer.close()
\ No newline at end of file
+        batch = [await queue.get()]
+        while len(batch) < BRIDGE_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        await inflight.acquire()
+        futures = []
+        try:
+            # send() waits while the producer's accumulator is full, which in turn fills the queue
+            for reading in batch:
+                futures.append(await producer.send(KAFKA_TOPIC, value=reading, key=str(reading["Device_ID"]).encode()))
+        except Exception as e:
+            stats.failed += len(batch) - len(futures)
+            print(f"[!] Kafka send failed: {e}")
+        task = asyncio.create_task(deliver(futures))
+        deliveries.add(task)
+        task.add_done_callback(deliveries.discard)
+
+
+def start_sender(queue, producer, stats, tasks, delay=0.0):
+    # Without a sender the queue fills and every device connection stalls, so never let it stay dead
+    async def run():
+        if delay:
+            await asyncio.sleep(delay)
+        await kafka_sender(queue, producer, stats)
+
+    task = asyncio.create_task(run())
+    tasks.add(task)
+
+    def on_done(done):
+        tasks.discard(done)
+        if done.cancelled():
+            return
+        print(f"[✗] Kafka sender stopped ({done.exception()!r}), restarting in 1s")
+        start_sender(queue, producer, stats, tasks, delay=1.0)
+
+    task.add_done_callback(on_done)
+
+
+async def report_stats(queue, stats):
+    while True:
+        await asyncio.sleep(10)
+        print(f"[bridge] connections={stats.connections} received={stats.received} sent={stats.sent} "
+              f"queued={queue.qsize()} invalid={stats.invalid} failed={stats.failed}")
+
+
+def raise_open_file_limit():
+    # Each device connection is a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run_socket_bridge():
+    from aiokafka import AIOKafkaProducer
+
+    raise_open_file_limit()
+    producer = AIOKafkaProducer(
+        bootstrap_servers=KAFKA_BROKER,
+        value_serializer=serialize,
+        linger_ms=20,
+        max_batch_size=256 * 1024,
+        request_timeout_ms=20000,
+    )
+    for i in range(10):
+        try:
+            await producer.start()
+            print(f"[✓] Bridge producer connected to Kafka at {KAFKA_BROKER}")
+            break
+        except Exception as e:
+            print(f"[!] Kafka connection failed (attempt {i+1}/10): {e}")
+            await asyncio.sleep(5)
+    else:
+        raise RuntimeError("Failed to connect to Kafka after 10 attempts")
+
+    queue = asyncio.Queue(maxsize=BRIDGE_QUEUE_SIZE)
+    stats = BridgeStats()
+    server = await asyncio.start_server(
+        lambda r, w: handle_device(r, w, queue, stats),
+        SOCKET_HOST,
+        SOCKET_PORT,
+        limit=BRIDGE_MAX_LINE_BYTES,
+        backlog=4096,
+    )
+    print(f"[→] Socket bridge listening on {SOCKET_HOST}:{SOCKET_PORT} -> topic '{KAFKA_TOPIC}'")
+    tasks = {asyncio.create_task(report_stats(queue, stats))}
+    start_sender(queue, producer, stats, tasks)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in list(tasks):
+            task.cancel()
+        await producer.stop()
+
+
+def main():
+    if PRODUCER_MODE == "socket":
+        try:
+            import uvloop
+            run = uvloop.run
+        except ImportError:
+            run = asyncio.run
+        try:
+            run(run_socket_bridge())
+        except KeyboardInterrupt:
+            print("\n[!] Stopping socket bridge...")
+    else:
+        run_random()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# route_stats.py
+"""
+Incrementally maintained per-lane statistics.
+
+Each consumed batch is pre-aggregated per (Route_From, Route_To) in memory and
+turned into one upsert per route using $inc / $max / $min, so the stats
+collection holds one small document per lane regardless of how much history
+has been ingested.
+
+Per-device last-seen times live in a separate collection, one small document
+per (lane, device), upserted with $max. A TTL index on `last_seen` expires
+devices that stop reporting, so the collection stays bounded, and the API
+counts active devices with an indexed range query instead of loading a map.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number  # drop NaN
+
+
+def _timestamp(doc: Dict) -> datetime:
+    ts = doc.get("timestamp")
+    if not isinstance(ts, datetime):
+        return datetime.now(timezone.utc)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def route_device_indexes(retention_seconds: int) -> List[IndexModel]:
+    """Indexes of the (lane, device) last-seen collection; the TTL one bounds its size."""
+    return [
+        IndexModel([("last_seen", ASCENDING)], expireAfterSeconds=retention_seconds),
+        IndexModel([("route", ASCENDING), ("last_seen", ASCENDING)]),
+    ]
+
+
+def route_stat_ops(docs: List[Dict]) -> List[UpdateOne]:
+    routes: Dict[Tuple[str, str], Dict] = {}
+    for doc in docs:
+        route_from, route_to = doc.get("Route_From"), doc.get("Route_To")
+        if not route_from or not route_to:
+            continue
+        agg = routes.get((route_from, route_to))
+        if agg is None:
+            agg = routes[(route_from, route_to)] = {
+                "count": 0, "temp_sum": 0.0, "temp_count": 0,
+                "max_temp": None, "min_battery": None, "last_seen": None,
+            }
+        agg["count"] += 1
+        temp = _number(doc.get("First_Sensor_temperature"))
+        if temp is not None:
+            agg["temp_sum"] += temp
+            agg["temp_count"] += 1
+            agg["max_temp"] = temp if agg["max_temp"] is None else max(agg["max_temp"], temp)
+        battery = _number(doc.get("Battery_Level"))
+        if battery is not None:
+            agg["min_battery"] = battery if agg["min_battery"] is None else min(agg["min_battery"], battery)
+        ts = _timestamp(doc)
+        agg["last_seen"] = ts if agg["last_seen"] is None else max(agg["last_seen"], ts)
+
+    ops = []
+    for (route_from, route_to), agg in routes.items():
+        maxes = {"last_seen": agg["last_seen"]}
+        if agg["max_temp"] is not None:
+            maxes["max_temperature"] = agg["max_temp"]
+        update = {
+            "$setOnInsert": {"Route_From": route_from, "Route_To": route_to},
+            "$inc": {
+                "reading_count": agg["count"],
+                "temperature_sum": agg["temp_sum"],
+                "temperature_count": agg["temp_count"],
+            },
+            "$max": maxes,
+        }
+        if agg["min_battery"] is not None:
+            update["$min"] = {"min_battery": agg["min_battery"]}
+        ops.append(UpdateOne({"_id": f"{route_from}|{route_to}"}, update, upsert=True))
+    return ops
+
+
+def route_device_ops(docs: List[Dict]) -> List[UpdateOne]:
+    """One $max upsert per (lane, device) in the batch; idempotent, so safe to retry."""
+    seen: Dict[Tuple[str, str], datetime] = {}
+    for doc in docs:
+        route_from, route_to, device = doc.get("Route_From"), doc.get("Route_To"), doc.get("Device_ID")
+        if not route_from or not route_to or not device:
+            continue
+        key = (f"{route_from}|{route_to}", str(device))
+        ts = _timestamp(doc)
+        seen[key] = max(ts, seen.get(key, ts))
+    return [
+        UpdateOne(
+            {"_id": f"{route}|{device}"},
+            {"$setOnInsert": {"route": route, "device": device}, "$max": {"last_seen": last_seen}},
+            upsert=True,
+        )
+        for (route, device), last_seen in seen.items()
+    ]
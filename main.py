@@ -1,24 +1,63 @@
 # main.py
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
 # Import backend APIRouter
 # IMPORTANT: your routes.py uses "app = APIRouter()"
 # so you must import it as "app", NOT "router"
 from backend.routes import app as routes_router
+from backend.device_index import device_route_index
+from backend import config, database
+from backend.archive import archiver
+from backend.summary import summary_reconciler
+from backend.reading_buffer import reading_buffer
+from backend.profiling import ProfilingMiddleware
+from backend.concurrency import ConcurrencyLimitMiddleware, heavy_route_limiters
+from backend.rate_limit import RateLimitMiddleware, TokenBucketStore, default_policies
+from backend.responses import FastJSONResponse
+from backend.templating import templates  # noqa: F401  (shared, bytecode-cached environment)
 
 BASE_DIR = Path(__file__).resolve().parent
 
+
+# --------------------------
+# Lifespan: resources are created here, not at import time
+# --------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(database.connect)  # warm up one pooled connection
+    await run_in_threadpool(database.ensure_indexes)
+    device_route_index.start()
+    if config.ARCHIVE_ENABLED:
+        archiver.start()
+    if config.SUMMARY_RECONCILE_ENABLED:
+        summary_reconciler.start()
+    if config.READING_BUFFER_ENABLED:
+        reading_buffer.start()
+    try:
+        yield
+    finally:
+        await reading_buffer.stop()
+        await run_in_threadpool(summary_reconciler.stop)
+        await run_in_threadpool(archiver.stop)
+        await run_in_threadpool(device_route_index.stop)
+        database.close()
+
+
 app = FastAPI(
     title="SCMXPERTLITE",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # --------------------------
@@ -32,6 +71,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --------------------------
+# Adaptive concurrency limits for heavy routes (503 + Retry-After when shed)
+# --------------------------
+if config.CONCURRENCY_LIMIT_ENABLED:
+    app.add_middleware(ConcurrencyLimitMiddleware, limiters=heavy_route_limiters)
+
+# --------------------------
+# Rate limiting (runs before any hashing or Mongo work)
+# --------------------------
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        policies=default_policies(),
+        store=TokenBucketStore(max_keys=config.RATE_LIMIT_MAX_KEYS),
+        trust_forwarded=config.RATE_LIMIT_TRUST_PROXY,
+    )
+
+# --------------------------
+# Request profiling (opt-in via X-Profile header or sampling)
+# --------------------------
+app.add_middleware(
+    ProfilingMiddleware,
+    token=config.PROFILE_TOKEN,
+    sample_rate=config.PROFILE_SAMPLE_RATE,
+    out_dir=config.PROFILE_DIR,
+    interval=config.PROFILE_INTERVAL_MS / 1000,
+)
+
 # --------------------------
 # Static files
 # --------------------------
@@ -41,11 +108,6 @@ app.mount(
     name="static"
 )
 
-# --------------------------
-# Templates (HTML)
-# --------------------------
-templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
-
 # --------------------------
 # Include backend routes
 # --------------------------